@@ -0,0 +1,122 @@
+# ARM instructions
+
+from enum import IntEnum
+
+class Op(IntEnum):
+    LABEL = 0       # name:
+    DIRECTIVE = 1   # .text, .global main...
+    STRING = 2      # name: .string "text"
+    MOV = 3
+    ADD = 4
+    SUB = 5
+    MUL = 6
+    CMP = 7
+    B = 8
+    BEQ = 9
+    BLT = 10
+    BGT = 11
+    BL = 12
+    BX = 13
+    PUSH = 14
+    POP = 15
+    LDR = 16
+    LDRB = 17
+    STR = 18
+    STRB = 19
+
+mnemonics = [ op.name for op in Op ]
+branches = { Op.B, Op.BEQ, Op.BLT, Op.BGT }
+
+class Reg(int):
+    '''Register operand'''
+
+    __slots__ = ()
+    names = [ 'R' + str(i) for i in range(13) ] + [ 'SP', 'LR', 'PC' ]
+
+    def __str__(self):
+        return self.names[self]
+
+    __repr__ = __str__
+
+R = [ Reg(i) for i in range(16) ]
+SP = R[13]
+LR = R[14]
+PC = R[15]
+
+class Imm:
+    '''Immediate operand: a number or the address of a label'''
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, Imm) and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __str__(self):
+        return '#' + str(self.value)
+
+    __repr__ = __str__
+
+class Mem:
+    '''Memory operand: [base, #offset]'''
+
+    __slots__ = ('base', 'offset')
+
+    def __init__(self, base, offset):
+        self.base = base
+        self.offset = offset
+
+    def __eq__(self, other):
+        return isinstance(other, Mem) and self.base == other.base and \
+               self.offset == other.offset
+
+    def __hash__(self):
+        return hash((self.base, self.offset))
+
+    def __str__(self):
+        return '[' + str(self.base) + ', #' + str(self.offset) + ']'
+
+    __repr__ = __str__
+
+class Instr:
+    '''Machine instruction. args are Reg, Imm, Mem, label names (str) or
+    tuples of Reg for PUSH and POP'''
+
+    __slots__ = ('op', 'args')
+
+    def __init__(self, op, args):
+        self.op = op
+        self.args = args
+
+    def __str__(self):
+        op = self.op
+
+        if op == Op.LABEL:
+            return self.args[0] + ':'
+        elif op == Op.DIRECTIVE:
+            return self.args[0]
+        elif op == Op.STRING:
+            return self.args[0] + ': .string "' + self.args[1] + '"'
+
+        return mnemonics[op] + ' ' + ' '.join(map(operandText, self.args))
+
+    __repr__ = __str__
+
+def operandText(operand):
+    if isinstance(operand, tuple):
+        return '{ ' + ' '.join(map(str, operand)) + ' }'
+
+    return str(operand)
+
+def text(instrs):
+    '''Assembly text of a list of instructions'''
+
+    if instrs:
+        return '\n'.join(map(str, instrs)) + '\n'
+    else:
+        return ''
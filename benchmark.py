@@ -0,0 +1,809 @@
+# Compiler benchmarks
+
+import gc
+import io
+import os
+import sys
+import mmap
+import random
+import shutil
+import tempfile
+import subprocess
+import tracemalloc
+import lexer
+import cparser
+import cfg
+import ir
+import ssa
+import optimizer
+import output
+import interp
+import compiler
+import logging
+import contextlib
+from time import time
+from collections import Counter
+
+template = '''int f%d(int a, int b)
+{
+    int x = 3;
+    int y;
+
+    // countdown
+    while (a > b) {
+        x = x + a * b;
+        a = a - 1;
+    }
+
+    // pick result
+    if (x == 0)
+        y = 1;
+    else
+        y = x - b;
+
+    return y;
+}
+
+'''
+
+constTemplate = '''int g%d(int a)
+{
+    int n = 8;
+    int k = 0;
+    int x;
+
+    x = n * 4 - 2;
+
+    if (n > 4)
+        a = a + x;
+    else
+        a = a - x;
+
+    while (k < 0)
+        a = a - 1;
+
+    return a * n;
+}
+
+'''
+
+exprTemplate = '''int h%d(int a, int b)
+{
+    int x;
+    int y;
+
+    x = a * b + a - b;
+    y = b * a + (a - b) * 2;
+
+    return x * y + a * b;
+}
+
+'''
+
+loopTemplate = '''int k%d(int a, int b)
+{
+    int i = 0;
+    int s = 0;
+
+    while (i < a) {
+        s = s + b * 4 + a * b;
+        i = i + 1;
+    }
+
+    return s;
+}
+
+'''
+
+stackTemplate = '''int s%d(int a, int b, int c, int d, int e, int f)
+{
+    int v[2];
+
+    v[0] = a + e;
+    v[1] = b * f;
+
+    return v[0] - v[1] + c * d;
+}
+
+'''
+
+example = os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+                       'examples', 'example.cmm')
+compilerPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+                            'compiler.py')
+
+HASH_SEEDS = [ '1', '2' ]   # PYTHONHASHSEED values the codegen check runs
+
+def generateSource(size, template = template):
+    '''Return a C-- program of about size bytes made of distinct functions'''
+
+    chunks = []
+    length = 0
+    n = 0
+
+    while length < size:
+        chunk = template % n
+        chunks.append(chunk)
+        length += len(chunk)
+        n += 1
+
+    return ''.join(chunks)
+
+def generateLocals(n):
+    '''Return a C-- function with n local variables, each one assigned from
+    the previous one'''
+
+    lines = [ 'int f(int v0)', '{' ]
+
+    for i in range(1, n):
+        lines.append('    int v' + str(i) + ';')
+
+    for i in range(1, n):
+        lines.append('    v' + str(i) + ' = v' + str(i - 1) + ' + 1;')
+
+    lines.append('    return v' + str(n - 1) + ';')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+def generateLoops(n, depth, nvars = 0):
+    '''Return a C-- function with n nests of depth while loops, each one
+    with an if inside, and nvars more variables live through all of them'''
+
+    lines = [ 'int f(int a, int b)', '{', '    int x;', '    int y;' ]
+    lines += [ '    int v' + str(i) + ';' for i in range(nvars) ]
+
+    for i in range(n):
+        for d in range(depth):
+            lines.append('    ' * (d + 1) + 'while (a > ' + str(d) + ') {')
+
+        indent = '    ' * (depth + 1)
+        lines.append(indent + 'if (x < b) x = x + y; else y = a;')
+        lines.append(indent + 'a = a - 1;')
+        lines += [ indent + 'v' + str(i) + ' = v' + str(i) + ' + a;' \
+                   for i in range(nvars) ]
+
+        for d in range(depth - 1, -1, -1):
+            lines.append('    ' * (d + 1) + '}')
+
+    lines.append('    return x;')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+def generateRandom(rng):
+    '''Return a random C-- program: a function g of one to six parameters,
+    and a function f(int a, int b) of nested ifs and while loops that calls
+    g in expressions, arguments and conditions. Every variable is
+    initialized, so the program has a single result'''
+
+    params = [ 'p' + str(i) for i in range(rng.randint(1, 6)) ]
+    names = params + [ 'w' + str(i) for i in range(rng.randint(0, 6)) ]
+    lines = [ 'int g(' + ', '.join('int ' + p for p in params) + ')', '{' ]
+    lines += [ '    int ' + w + ' = ' + str(rng.randint(0, 3)) + ';' \
+               for w in names[len(params):] ]
+
+    for i in range(6):
+        lines.append('    ' + rng.choice(names) + ' = ' + \
+                     rng.choice(names) + ' ' + rng.choice('+-*') + ' ' + \
+                     rng.choice(names) + ';')
+
+    lines += [ '    return ' + ' + '.join(names) + ';', '}', '' ]
+    variables = [ 'a', 'b' ] + [ 'v' + str(i) \
+                                 for i in range(rng.randint(0, 10)) ]
+    lines += [ 'int f(int a, int b)', '{' ]
+    lines += [ '    int ' + v + ' = ' + str(rng.randint(0, 4)) + ';' \
+               for v in variables[2:] ]
+
+    def leaf():
+        if rng.random() < 0.7:
+            return rng.choice(variables)
+        else:
+            return str(rng.randint(0, 5))
+
+    def call(depth):
+        return 'g(' + ', '.join(expr(depth + 1) for p in params) + ')'
+
+    def expr(depth = 0):
+        r = rng.random()
+
+        if depth > 2 or r < 0.3:
+            return leaf()
+        elif r < 0.4:
+            return '-' + rng.choice(variables)
+        elif r < 0.55:
+            return call(depth)
+        else:
+            return expr(depth + 1) + ' ' + rng.choice('+-*') + ' ' + \
+                   expr(depth + 1)
+
+    # The lexer reads <= and >= as < or > followed by =, so they are left
+    # out
+
+    def cond():
+        return expr(1) + ' ' + rng.choice([ '==', '!=', '<', '>' ]) + ' ' + \
+               expr(1)
+
+    def block(depth, indent):
+        for i in range(rng.randint(1, 5)):
+            r = rng.random()
+
+            if r < 0.5 or depth > 2:
+                lines.append(indent + rng.choice(variables) + ' = ' + \
+                             expr() + ';')
+            elif r < 0.6:
+                lines.append(indent + call(0) + ';')
+            elif r < 0.75:
+                lines.append(indent + 'if (' + cond() + ') {')
+                block(depth + 1, indent + '    ')
+
+                if rng.random() < 0.5:
+                    lines.append(indent + '} else {')
+                    block(depth + 1, indent + '    ')
+
+                lines.append(indent + '}')
+            elif r < 0.9:
+                v = rng.choice(variables)
+                lines.append(indent + 'while (' + v + ' > 0) {')
+                block(depth + 1, indent + '    ')
+                lines.append(indent + '    ' + v + ' = ' + v + ' - 1;')
+                lines.append(indent + '}')
+            else:
+                lines.append(indent + 'if (' + cond() + ') return ' + \
+                             expr() + ';')
+
+    block(0, '    ')
+    lines += [ '    return ' + ' + '.join(variables) + ';', '}' ]
+    return '\n'.join(lines) + '\n'
+
+def sweepLiveness(graph):
+    '''Reference liveness: sweep over every block in depth-first order until
+    nothing changes'''
+
+    blocks = graph.postorder[::-1]
+    changes = True
+    varnum = { }
+
+    for block in blocks:
+        block.fill(varnum)
+
+    while changes:
+        changes = False
+
+        for block in blocks:
+            if block.liveness():
+                changes = True
+
+def report(name, seconds, count, unit):
+    print('%-32s %10.3f sec. %14.0f %s/sec.' % (name, seconds, \
+          count / seconds if seconds > 0 else 0, unit))
+
+def benchLexer(args):
+    '''Lexer throughput in tokens/sec. Args: sizes in KB'''
+
+    sizes = [ int(a) for a in args ] or [ 1, 1024, 50 * 1024 ]
+
+    for kb in sizes:
+        source = generateSource(kb * 1024)
+        tStart = time()
+        count = 0
+
+        for token in lexer.lexer(source):
+            count += 1
+
+        report('lexer ' + str(kb) + ' KB', time() - tStart, count, 'tokens')
+
+def benchDominators(args):
+    '''Time to compute predecessors, dominator tree and dominance frontiers
+    of functions of nested while loops. Args: depth, then numbers of nests'''
+
+    depth = int(args[0]) if args else 8
+    sizes = [ int(a) for a in args[1:] ] or [ 500, 1000, 2000, 4000 ]
+
+    for n in sizes:
+        func = cparser.Parser(generateLoops(n, depth)).program()[0]
+        graph = cfg.gBlock(func.block)
+        blocks = len(graph.blocks)
+        tStart = time()
+        graph.preds
+        graph.domtree
+        graph.frontiers
+        report('dominators ' + str(blocks) + ' blocks', time() - tStart, \
+               blocks, 'blocks')
+
+def benchKeywords(args):
+    '''Regex keywords versus keyword table on keyword-dense and
+    identifier-dense inputs, in characters/sec, since names like 'iffy' are
+    one token with the table and two without it. Args: size in KB'''
+
+    size = (int(args[0]) if args else 1024) * 1024
+    words = { 'keyword-dense': 'if else while return print int float char void',
+              'identifier-dense': 'index value total count width height ' + \
+                                  'iter floor chart voidptr ifnum elsewhere' }
+
+    for name in sorted(words):
+        text = ' '.join(words[name].split()) + ' '
+        source = text * (size // len(text) + 1)
+
+        for kwtable in (False, True):
+            tStart = time()
+
+            for token in lexer.lexer(source, kwtable):
+                pass
+
+            report(name + (' (table)' if kwtable else ' (regex)'), \
+                   time() - tStart, len(source), 'chars')
+
+def benchCodegen(args):
+    '''Code generation time with several processes for every register
+    allocator, checking that the output is the same as with one, and that
+    compiling under other hash seeds gives the same file. Half the
+    functions keep arguments and an array on the stack. Args: size in KB,
+    then numbers of processes'''
+
+    size = (int(args[0]) if args else 1024) * 1024
+    jobs = [ int(a) for a in args[1:] ] or [ 1, 2, 4 ]
+    source = generateSource(size // 2) + \
+             generateSource(size // 2, stackTemplate)
+    program = cparser.Parser(source).program()
+    logging.getLogger('output').setLevel(logging.WARNING)
+    fd, path = tempfile.mkstemp(suffix = '.s')
+    os.close(fd)
+    fd, srcPath = tempfile.mkstemp(suffix = '.cmm')
+
+    with os.fdopen(fd, 'w') as file:
+        file.write(source)
+
+    outdir = tempfile.mkdtemp()
+    outPath = compiler.outputPath(srcPath, outdir)
+
+    try:
+        for allocator in sorted(output.allocators):
+            serial = None
+
+            for n in [ 1 ] + jobs:
+                graphs = [ cfg.gFunction(f) for f in program ]
+                tStart = time()
+                output.write(graphs, path, n, allocator = allocator)
+                seconds = time() - tStart
+
+                with open(path) as file:
+                    text = file.read()
+
+                if serial == None:
+                    serial = text
+                    continue
+
+                report('codegen ' + allocator + ' ' + str(n) + ' processes', \
+                       seconds, len(graphs), 'functions')
+
+                if text != serial:
+                    print('Error: ' + allocator + ' output with ' + str(n) + \
+                          ' processes differs from the serial one.', \
+                          file = sys.stderr)
+
+            # Sets of variables are ordered by address, which changes with
+            # the hash seed, so the whole compiler runs under several ones
+
+            texts = set()
+
+            for seed in HASH_SEEDS:
+                for n in [ 1, max(jobs) ]:
+                    subprocess.run([ sys.executable, compilerPath, \
+                                     '-a', allocator, '-J', str(n), \
+                                     '-o', outdir, srcPath ], \
+                                   env = dict(os.environ, \
+                                              PYTHONHASHSEED = seed), \
+                                   stdout = subprocess.DEVNULL, check = True)
+
+                    with open(outPath) as file:
+                        texts.add(file.read())
+
+            if len(texts) > 1:
+                print('Error: ' + allocator + ' output differs between ' + \
+                      'hash seeds.', file = sys.stderr)
+    finally:
+        os.remove(path)
+        os.remove(srcPath)
+        shutil.rmtree(outdir)
+
+def benchCheck(args):
+    '''Random programs run by the interpreter before and after
+    optimization, and compiled at -O 0 and -O 1 with every register
+    allocator and run on the simulated machine. Reports the programs whose
+    results differ. Args: number of programs, first seed'''
+
+    count = int(args[0]) if args else 100
+    first = int(args[1]) if len(args) > 1 else 0
+    fd, path = tempfile.mkstemp(suffix = '.s')
+    os.close(fd)
+    failed = 0
+    skipped = 0
+    tStart = time()
+
+    def graphs(source, level):
+        program = cparser.Parser(source).program()
+        graphs = [ cfg.gFunction(f) for f in program ]
+
+        for graph in graphs:
+            optimizer.optimize(graph, level)
+
+        return graphs
+
+    try:
+        for seed in range(first, first + count):
+            rng = random.Random(seed)
+            source = generateRandom(rng)
+            fargs = [ rng.randint(-3, 6), rng.randint(-3, 6) ]
+
+            # Programs whose loops do not end are left out
+
+            try:
+                expected = interp.Interpreter(graphs(source, 0)).call('f', \
+                                                                      fargs)
+            except interp.OutOfFuel:
+                skipped += 1
+                continue
+
+            results = { }
+
+            for level in (0, 1):
+                if level > 0:
+                    name = 'interpreter -O ' + str(level)
+                    results[name] = interp.Interpreter( \
+                        graphs(source, level)).call('f', fargs)
+
+                for allocator in sorted(output.allocators):
+                    name = allocator + ' -O ' + str(level)
+
+                    try:
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            output.write(graphs(source, level), path, 1, \
+                                         False, level, allocator)
+
+                        with open(path) as file:
+                            machine = interp.Machine(file.read())
+
+                        results[name] = machine.call('f', fargs)
+                    except Exception as e:
+                        results[name] = 'failed: ' + repr(e)
+
+            wrong = [ name + ' gives ' + str(results[name]) \
+                      for name in sorted(results) \
+                      if results[name] != expected ]
+
+            if wrong:
+                failed += 1
+                print('Error: seed ' + str(seed) + ' returns ' + \
+                      str(expected) + ', but ' + ', '.join(wrong) + '.', \
+                      file = sys.stderr)
+    finally:
+        os.remove(path)
+
+    report('check', time() - tStart, count, 'programs')
+    print('%d programs, %d failed, %d left out for not ending' % \
+          (count, failed, skipped))
+
+def benchRegalloc(args):
+    '''Allocation time and spilled variables of each register allocator on
+    optimized functions: nested while loops, the same with 12 more variables
+    live through them, 20 nests with n / 5 more variables, and a chain of n
+    local variables. The time is the best of three runs. Args: sizes'''
+
+    sizes = [ int(a) for a in args ] or [ 100, 300, 1000 ]
+
+    for n in sizes:
+        inputs = [ ('nests', generateLoops(n, 2)), \
+                   ('live', generateLoops(n, 2, 12)), \
+                   ('wide', generateLoops(20, 2, n // 5)), \
+                   ('locals', generateLocals(n)) ]
+
+        for kind, source in inputs:
+            for name in sorted(output.allocators):
+                best = None
+
+                # Allocation changes the graph, so every run gets a new one,
+                # and garbage left by earlier runs is collected before it
+
+                for run in range(3):
+                    func = cparser.Parser(source).program()[0]
+                    graph = cfg.gFunction(func)
+                    optimizer.optimize(graph)
+                    gc.collect()
+                    tStart = time()
+
+                    try:
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            alloc = output.allocators[name](graph, \
+                                                            output.NREGISTERS)
+                            alloc()
+
+                        result = str(len(alloc.toSpill())) + ' spilled'
+                    except Exception as e:
+                        result = 'failed: ' + str(e)
+
+                    elapsed = time() - tStart
+
+                    if best == None or elapsed < best:
+                        best = elapsed
+
+                print('%-32s %10.3f sec. %5d variables  %s' % \
+                      ('regalloc ' + name + ' ' + kind + ' ' + str(n), \
+                       best, len(graph.vars), result))
+
+def benchSSA(args):
+    '''Time to put functions of nested while loops into SSA form and back.
+    Args: numbers of nests'''
+
+    sizes = [ int(a) for a in args ] or [ 100, 300, 1000 ]
+
+    for n in sizes:
+        func = cparser.Parser(generateLoops(n, 4, 4)).program()[0]
+        graph = cfg.gBlock(func.block)
+        graph.func = func
+        blocks = len(graph.blocks)
+        tStart = time()
+        ssa.construct(graph)
+        phis = sum(isinstance(stmt, ir.PhiStmt) for block in graph \
+                   for stmt in block)
+        ssa.destruct(graph)
+        report('ssa ' + str(blocks) + ' blocks ' + str(phis) + ' phis', \
+               time() - tStart, blocks, 'blocks')
+
+def benchStream(args):
+    '''Peak traced memory lexing a memory-mapped file versus a str read into
+    memory. Args: sizes in MB'''
+
+    sizes = [ int(a) for a in args ] or [ 1, 4 ]
+    fd, path = tempfile.mkstemp(suffix = '.cmm')
+
+    try:
+        for mb in sizes:
+            with os.fdopen(os.dup(fd), 'w') as f:
+                f.seek(0)
+                f.truncate()
+                f.write(generateSource(mb * 1024 * 1024))
+
+            for mode in ('str', 'mmap'):
+                tracemalloc.start()
+                tStart = time()
+
+                with open(path, 'rb') as f:
+                    if mode == 'str':
+                        source = f.read().decode()
+                    else:
+                        source = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+                    for token in lexer.lexer(source):
+                        pass
+
+                    if mode == 'mmap':
+                        source.close()
+
+                seconds = time() - tStart
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                del source
+                print('%-28s %10.3f sec. %10.1f MB peak' % \
+                      ('lexer ' + mode + ' ' + str(mb) + ' MB', seconds, \
+                       peak / 1024 / 1024))
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+def benchSymtab(args):
+    '''Parse time of functions with many locals. Args: numbers of symbols'''
+
+    sizes = [ int(a) for a in args ] or [ 1000, 10000 ]
+
+    for n in sizes:
+        source = generateLocals(n)
+        tStart = time()
+        cparser.Parser(source).program()
+        report('parse ' + str(n) + ' symbols', time() - tStart, n, 'symbols')
+
+def benchTrace(args):
+    '''Code generation time with tracing off and on. The trace goes to
+    os.devnull. Args: size in KB'''
+
+    size = (int(args[0]) if args else 1024) * 1024
+    program = cparser.Parser(generateSource(size)).program()
+    fd, path = tempfile.mkstemp(suffix = '.s')
+    os.close(fd)
+    devnull = open(os.devnull, 'w')
+    stream = output.handler.setStream(devnull)
+
+    try:
+        for trace in (False, True):
+            graphs = [ cfg.gFunction(f) for f in program ]
+            tStart = time()
+            output.write(graphs, path, 1, trace)
+            report('codegen trace ' + ('on' if trace else 'off'), \
+                   time() - tStart, len(graphs), 'functions')
+    finally:
+        output.handler.setStream(stream)
+        devnull.close()
+        os.remove(path)
+
+def benchTokens(args):
+    '''Memory per token of a list of Token objects versus a TokenBuffer.
+    Args: size in KB'''
+
+    source = generateSource((int(args[0]) if args else 1024) * 1024)
+
+    for name, build in (('Token list', lambda: list(lexer.lexer(source))),
+                        ('TokenBuffer', lambda: lexer.TokenBuffer(source))):
+        tracemalloc.start()
+        tStart = time()
+        tokens = build()
+        seconds = time() - tStart
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('%-28s %10.3f sec. %10.1f bytes/token' % \
+              (name, seconds, size / len(tokens)))
+        del tokens
+
+def benchLiveness(args):
+    '''Liveness time of the worklist solver versus sweeping every block, on
+    functions of nested while loops. Args: depth, then numbers of nests'''
+
+    depth = int(args[0]) if args else 16
+    sizes = [ int(a) for a in args[1:] ] or [ 100, 300, 1000 ]
+
+    for n in sizes:
+        func = cparser.Parser(generateLoops(n, depth)).program()[0]
+
+        for name, solve in (('sweep', sweepLiveness), \
+                            ('worklist', cfg.Graph.liveness)):
+            graph = cfg.gBlock(func.block)
+            blocks = len(graph.blocks)
+            tStart = time()
+            solve(graph)
+            report('liveness ' + name + ' ' + str(blocks) + ' blocks', \
+                   time() - tStart, blocks, 'blocks')
+
+def benchDataflow(args):
+    '''Liveness time and peak memory on functions with many variables live
+    through nested loops. Memory is measured on a second run, as tracing
+    slows allocations down. Args: numbers of variables'''
+
+    sizes = [ int(a) for a in args ] or [ 10, 100, 500, 1000 ]
+
+    for nvars in sizes:
+        func = cparser.Parser(generateLoops(100, 4, nvars)).program()[0]
+        graph = cfg.gBlock(func.block)
+        tStart = time()
+        graph.liveness()
+        seconds = time() - tStart
+        graph = cfg.gBlock(func.block)
+        tracemalloc.start()
+        graph.liveness()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('%-28s %10.3f sec. %10.1f MB peak' % \
+              ('liveness ' + str(nvars) + ' variables', seconds, \
+               peak / 1024 / 1024))
+
+def benchOptimizer(args):
+    '''Output size and compile time with the first n optimizer passes, for
+    n = 0 to all of them, on examples/example.cmm and generated programs.
+    Args: size in KB'''
+
+    size = (int(args[0]) if args else 64) * 1024
+    fd, path = tempfile.mkstemp(suffix = '.s')
+    os.close(fd)
+    logging.getLogger('output').setLevel(logging.WARNING)
+
+    with open(example) as f:
+        inputs = [ ('example.cmm', f.read()) ]
+
+    inputs.append(('loops', generateSource(size)))
+    inputs.append(('constants', generateSource(size, constTemplate)))
+    inputs.append(('expressions', generateSource(size, exprTemplate)))
+    inputs.append(('invariants', generateSource(size, loopTemplate)))
+
+    try:
+        for name, source in inputs:
+            for n in range(len(optimizer.passes) + 1):
+                program = cparser.Parser(source).program()
+                graphs = [ cfg.gFunction(f) for f in program ]
+                stats = Counter()
+                tStart = time()
+
+                for graph in graphs:
+                    stats += optimizer.optimize(graph, 1, optimizer.passes[:n])
+
+                output.write(graphs, path)
+                seconds = time() - tStart
+
+                with open(path) as f:
+                    lines = len(f.readlines())
+
+                passes = [ optimizer.name(p) for p in optimizer.passes[:n] ]
+                print('%-28s %10.3f sec. %8d lines  passes: %s' % \
+                      ('optimizer ' + name, seconds, lines, \
+                       ', '.join(passes) or 'none'))
+
+            for optpass in sorted(stats):
+                print('    %-24s %8d' % (optpass, stats[optpass]))
+    finally:
+        os.remove(path)
+
+def benchOrder(args):
+    '''Time to build a large function's graph and iterate over its blocks
+    ten times, as code generation does. Args: numbers of loops'''
+
+    sizes = [ int(a) for a in args ] or [ 1000, 3000 ]
+
+    for n in sizes:
+        func = cparser.Parser(generateLoops(n, 2)).program()[0]
+        tStart = time()
+        graph = cfg.gFunction(func)
+
+        for i in range(10):
+            for block in graph:
+                pass
+
+        report('order ' + str(len(graph.blocks)) + ' blocks', \
+               time() - tStart, len(graph.blocks), 'blocks')
+
+def benchPeephole(args):
+    '''Output size without and with the peephole optimizer, for
+    examples/example.cmm and generated programs, and the instructions removed
+    by each rule. Args: sizes in KB'''
+
+    sizes = [ int(a) for a in args ] or [ 64, 1024 ]
+    fd, path = tempfile.mkstemp(suffix = '.s')
+    os.close(fd)
+    logging.getLogger('output').setLevel(logging.WARNING)
+
+    with open(example) as f:
+        inputs = [ ('example.cmm', f.read()) ]
+
+    inputs += [ (str(kb) + ' KB', generateSource(kb * 1024)) for kb in sizes ]
+
+    try:
+        for name, source in inputs:
+            program = cparser.Parser(source).program()
+            lines = []
+
+            for optimize in (0, 1):
+                graphs = [ cfg.gFunction(f) for f in program ]
+                tStart = time()
+                stats = output.write(graphs, path, 1, False, optimize)
+                seconds = time() - tStart
+
+                with open(path) as f:
+                    lines.append(len(f.readlines()))
+
+            print('%-28s %10.3f sec. %8d -> %8d lines (%.1f%% smaller)' % \
+                  ('peephole ' + name, seconds, lines[0], lines[1], \
+                   100 * (lines[0] - lines[1]) / lines[0]))
+
+            for rule in sorted(stats):
+                print('    %-24s %8d removed' % (rule, stats[rule]))
+    finally:
+        os.remove(path)
+
+benchmarks = { 'check': benchCheck,
+               'codegen': benchCodegen,
+               'dataflow': benchDataflow,
+               'dominators': benchDominators,
+               'keywords': benchKeywords,
+               'lexer': benchLexer,
+               'liveness': benchLiveness,
+               'optimizer': benchOptimizer,
+               'order': benchOrder,
+               'peephole': benchPeephole,
+               'regalloc': benchRegalloc,
+               'ssa': benchSSA,
+               'stream': benchStream,
+               'symtab': benchSymtab,
+               'tokens': benchTokens,
+               'trace': benchTrace }
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print('Usage: python benchmark.py <' + '|'.join(sorted(benchmarks)) + \
+              '> [args...]', file = sys.stderr)
+        sys.exit(1)
+
+    benchmarks[sys.argv[1]](sys.argv[2:])
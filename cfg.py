@@ -5,6 +5,7 @@
 import ir
 import sys
 import logging
+from collections import deque
 
 logger = logging.getLogger('cfg')
 handler = logging.StreamHandler(sys.stdout)
@@ -15,50 +16,41 @@ logger.addHandler(handler)
 labelnum = 0
 
 class Node(list):
+    '''Basic block. gen, kill, livein and liveout are bit sets of the
+    variables numbered by Graph.number'''
+
     def __init__(self):
         self.object = object()
         self.label = None
         self.children = []
-        self.livein = set()
-        self.liveout = set()
-        self.gen = set()
-        self.kill = set()
+        self.livein = 0
+        self.liveout = 0
+        self.gen = 0
+        self.kill = 0
 
     def hasReturn(self):
-        global visited
-        visited.add(self)
-        
         for stmt in self:
             if isinstance(stmt, ir.ReturnStmt):
                 return True
 
-        childret = False
-        
-        for child in self.children:
-            if child not in visited:
-                if child.hasReturn():
-                    childret = True
-                else:
-                    return False
+        return False
 
-        return childret
+    def fill(self, varnum):
+        '''Initializes gen and kill. varnum maps variables to bit numbers,
+        and new variables are numbered as they are found'''
 
-    def fill(self):
-        '''Initializes gen and kill'''
+        gen = 0
+        kill = 0
 
         for stmt in self:
-            uses = stmt.uses()
-
-            if isinstance(stmt, ir.AssignStmt):
-                defines = stmt.defines()
-            else:
-                defines = set()
+            gen |= bitset(stmt.uses(), varnum) & ~kill
 
-            uses -= self.kill
-            self.gen |= uses
-            self.kill |= defines
+            if isinstance(stmt, (ir.AssignStmt, ir.PhiStmt)):
+                kill |= bitset(stmt.defines(), varnum)
 
-        self.livein = set(self.gen)
+        self.gen = gen
+        self.kill = kill
+        self.livein = gen
 
     def getLabel(self):
         global labelnum
@@ -70,18 +62,19 @@ class Node(list):
         return self.label
 
     def liveness(self):
-        '''One iteration of liveness algorithm'''
-
-        lin = len(self.livein)
-        lout = len(self.liveout)
+        '''One step of liveness algorithm: recompute liveout and livein from
+        the children. Returns whether livein changed'''
 
-        self.liveout = set()
+        liveout = 0
 
         for s in self.children:
-            self.liveout |= s.livein
+            liveout |= s.livein
 
-        self.livein = self.gen | (self.liveout - self.kill)
-        return len(self.livein) != lin or len(self.liveout) != lout
+        livein = self.gen | (liveout & ~self.kill)
+        changed = livein != self.livein
+        self.liveout = liveout
+        self.livein = livein
+        return changed
 
     def __hash__(self):
         return hash(self.object)
@@ -92,13 +85,18 @@ class Graph:
         self.last = self.first
         self.func = func
         self.toSpill = set()
+        self.cache = { }    # Block order and analyses, see invalidate()
+        self.vars = []      # bit number -> variable
+        self.varnum = { }   # variable -> bit number
 
     def __iadd__(self, node):
         self.last += node.first
         self.last.children = node.first.children
 
-        if node.first != node.last:
+        if node.first is not node.last:
             self.last = node.last
+
+        self.invalidate()
         return self
 
     def __repr__(self):
@@ -108,32 +106,237 @@ class Graph:
             return 'Graphs object'
 
     def hasReturn(self):
-        global visited
-        visited = set()
-        return self.first.hasReturn()
+        '''Whether every path from the entry reaches a return'''
+
+        visited = { self.first }
+        stack = [ self.first ]
+
+        while stack:
+            node = stack.pop()
+
+            if node.hasReturn():
+                continue
+
+            if not node.children:
+                return False
+
+            for child in node.children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+
+        return True
+
+    def invalidate(self):
+        '''Forget the block order, predecessors and dominators. Call it after
+        changing the children of any block'''
+
+        self.cache = { }
+
+    def cached(self, name, compute):
+        if name not in self.cache:
+            self.cache[name] = compute()
+
+        return self.cache[name]
+
+    @property
+    def blocks(self):
+        '''Blocks reachable from the entry in depth-first preorder'''
+
+        return self.cached('order', lambda : depthFirst(self.first))[0]
+
+    @property
+    def postorder(self):
+        '''Blocks reachable from the entry in depth-first postorder'''
+
+        return self.cached('order', lambda : depthFirst(self.first))[1]
+
+    @property
+    def preds(self):
+        '''Block -> list of its predecessors'''
+
+        return self.cached('preds', self.predecessors)
+
+    @property
+    def idom(self):
+        '''Block -> its immediate dominator, None for the entry'''
+
+        return self.cached('idom', self.dominators)
+
+    @property
+    def domtree(self):
+        '''Block -> list of the blocks it immediately dominates'''
+
+        return self.cached('domtree', self.dominatorTree)
+
+    @property
+    def frontiers(self):
+        '''Block -> set of the blocks in its dominance frontier'''
+
+        return self.cached('frontiers', self.dominanceFrontiers)
+
+    @property
+    def loops(self):
+        '''Loop header -> set of the blocks in its natural loop'''
+
+        return self.cached('loops', self.naturalLoops)
+
+    def predecessors(self):
+        preds = { block : [] for block in self.blocks }
+
+        for block in self.blocks:
+            for child in block.children:
+                preds[child].append(block)
+
+        return preds
+
+    def dominators(self):
+        '''Immediate dominators by the algorithm of Cooper, Harvey and
+        Kennedy. Blocks are numbered in postorder, so the entry has the
+        highest number and a dominator a higher one than the blocks it
+        dominates'''
+
+        blocks = self.postorder
+        index = { block : i for i, block in enumerate(blocks) }
+        preds = [ [ index[p] for p in self.preds[block] ] for block in blocks ]
+        entry = len(blocks) - 1
+        idom = [ None ] * len(blocks)
+        idom[entry] = entry
+        changed = True
+
+        while changed:
+            changed = False
+
+            for i in range(entry - 1, -1, -1):
+                new = None
+
+                for p in preds[i]:
+                    if idom[p] == None:
+                        continue
+                    elif new == None:
+                        new = p
+                    else:
+                        while p != new:
+                            while p < new:
+                                p = idom[p]
+                            while new < p:
+                                new = idom[new]
+
+                if idom[i] != new:
+                    idom[i] = new
+                    changed = True
+
+        result = { block : blocks[idom[i]] for i, block in enumerate(blocks) }
+        result[self.first] = None
+        return result
+
+    def dominatorTree(self):
+        tree = { block : [] for block in self.blocks }
+
+        for block in self.blocks:
+            if self.idom[block] != None:
+                tree[self.idom[block]].append(block)
+
+        return tree
+
+    def dominanceFrontiers(self):
+        idom = self.idom
+        frontiers = { block : set() for block in self.blocks }
+
+        for block in self.blocks:
+            preds = self.preds[block]
+
+            if len(preds) > 1:
+                for runner in preds:
+                    while runner is not idom[block]:
+                        frontiers[runner].add(block)
+                        runner = idom[runner]
+
+        return frontiers
+
+    def naturalLoops(self):
+        '''Natural loops of the back edges, the edges to a block that
+        dominates their source. Loops with the same header are merged'''
+
+        preds = self.preds
+        index = { block : i for i, block in enumerate(self.postorder) }
+        loops = { }
+
+        # Only a retreating edge, to a block not after its source in
+        # postorder, can go back to a dominator
+
+        for block in self.blocks:
+            for child in block.children:
+                if index[child] >= index[block] and \
+                   self.dominates(child, block):
+                    body = loops.setdefault(child, { child })
+                    stack = [ block ]
+
+                    while stack:
+                        node = stack.pop()
+
+                        if node not in body:
+                            body.add(node)
+                            stack += preds[node]
+
+        return loops
+
+    def dominates(self, a, b):
+        '''Whether block a dominates block b'''
+
+        idom = self.idom
+
+        while b != None:
+            if b is a:
+                return True
+
+            b = idom[b]
+
+        return False
 
     def __iter__(self):
-        l = []
-        getBlocks(l, self.first)
-        return l.__iter__()
+        return iter(self.blocks)
 
     def liveness(self):
-        changes = True
-        
-        for block in self:
-            block.fill()
+        '''Worklist liveness. Blocks are seeded in postorder, so successors
+        are mostly done before their predecessors, and a block whose livein
+        changes only requeues its predecessors'''
 
-        while changes:
-            changes = False
-            
-            for block in self:
-                if block.liveness():
-                    changes = True
+        blocks = self.postorder
+        index = { block : i for i, block in enumerate(blocks) }
+        preds = [ [ index[p] for p in self.preds[block] ] for block in blocks ]
+        self.varnum = { }
+
+        for block in blocks:
+            block.fill(self.varnum)
+
+        work = deque(range(len(blocks)))
+        queued = bytearray(b'\1') * len(blocks)
+
+        while work:
+            i = work.popleft()
+            queued[i] = 0
+
+            if blocks[i].liveness():
+                for pred in preds[i]:
+                    if not queued[pred]:
+                        queued[pred] = 1
+                        work.append(pred)
+
+        self.vars = list(self.varnum)
+
+    def varset(self, bits):
+        '''Set of the variables in a bit set'''
+
+        return members(bits, self.vars)
 
     def spill(self, var):
-        for block in self:
-            block.gen.discard(var)
-            block.kill.discard(var)
+        if var in self.varnum:
+            mask = ~(1 << self.varnum[var])
+
+            for block in self:
+                block.gen &= mask
+                block.kill &= mask
 
         self.toSpill.add(var)
     
@@ -192,24 +395,78 @@ def gBranch(stmt):
             graph.last.children.append(endgraph.first)
             
     elif isinstance(stmt, ir.LoopStmt):
-        graph.last.append(stmt.cond)
+
+        # The condition gets its own node: graph.first is merged into the
+        # preceding block, but the back edge must reach the condition
+
+        condnode = Node()
+        condnode.append(stmt.cond)
         loopgraph = gStatement(stmt.stmt)
         endgraph = Graph()
-        graph.last.children.append(graph.first)
-        graph.last.children.append(loopgraph.first)
-        graph.last.children.append(endgraph.first)
-        loopgraph.last.children.append(graph.first)
+        graph.last.children.append(condnode)
+        condnode.children.append(loopgraph.first)
+        condnode.children.append(endgraph.first)
+        loopgraph.last.children.append(condnode)
     else:
         raise Exception('stmt is not a branch statement')
 
     graph.last = endgraph.last
     return graph
 
-def getBlocks(l, node):
-    if node in l:
-        return
+def bitset(variables, varnum):
+    '''Bit set of some variables. Unknown variables are numbered in the
+    order they were declared, not in the order of the set, which depends
+    on where they are in memory'''
+
+    bits = 0
+    unknown = []
+
+    for var in variables:
+        n = varnum.get(var)
+
+        if n == None:
+            unknown.append(var)
+        else:
+            bits |= 1 << n
+
+    for var in sorted(unknown, key = lambda v : v.serial):
+        n = varnum[var] = len(varnum)
+        bits |= 1 << n
+
+    return bits
+
+def members(bits, vars):
+    '''Variables in a bit set, given the list of numbered variables'''
+
+    result = set()
+
+    while bits:
+        low = bits & -bits
+        result.add(vars[low.bit_length() - 1])
+        bits ^= low
+
+    return result
 
-    l.append(node)
+def depthFirst(first):
+    '''Blocks reachable from first, as lists in depth-first preorder and
+    postorder'''
+
+    pre = [ first ]
+    post = []
+    visited = { first }
+    stack = [ (first, iter(first.children)) ]
+
+    while stack:
+        node, children = stack[-1]
+
+        for child in children:
+            if child not in visited:
+                visited.add(child)
+                pre.append(child)
+                stack.append((child, iter(child.children)))
+                break
+        else:
+            stack.pop()
+            post.append(node)
 
-    for child in node.children:
-        getBlocks(l, child)
+    return pre, post
@@ -2,24 +2,144 @@
 # Victor Manuel Fernandez Castro
 # May 22, 2014
 
+import os
+import sys
+import argparse
 import cparser
 import cfg
-import sys
-import regalloc
+import optimizer
 import output
 from time import time
+from concurrent.futures import ProcessPoolExecutor
+
+def compileFile(path, outpath, jobs = 1, trace = False, optimize = 1, \
+                allocator = 'greedy'):
+    '''Compile a C-- file into outpath, generating code for its functions
+    with jobs processes, and logging it if trace is set. optimize is the
+    optimization level and allocator the register allocator. Returns
+    (path, outpath, error, time), where error is None on success'''
 
-if __name__ == '__main__':
-    cparser.init(open('examples/example.cmm', 'r').read())
     tStart = time()
+    error = None
+    parser = None
 
     try:
-        program = cparser.program()
+        with open(path, 'rb') as source:
+            parser = cparser.Parser(source)
+            program = parser.program()
+
         graphs = [cfg.gFunction(f) for f in program]
-        output.write(graphs, 'examples/output.s')
-        tEnd = time()
-        print('Time:', tEnd - tStart, 'sec.')
+
+        for graph in graphs:
+            optimizer.optimize(graph, optimize)
+
+        output.write(graphs, outpath, jobs, trace, optimize, allocator)
     except SyntaxError as e:
-        print('Syntax error at line', cparser.token0.line, 'near <', \
-              cparser.token0.string, '>', e, file = sys.stderr)
-        
+        error = 'Syntax error'
+
+        if parser != None:
+            error += ' at line ' + str(parser.token0.line) + \
+                     ' near < ' + str(parser.token0.string) + ' >'
+
+        error += ' ' + str(e)
+    except Exception as e:
+        error = type(e).__name__ + ': ' + str(e)
+
+    if error != None and os.path.exists(outpath):
+        os.remove(outpath)
+
+    return path, outpath, error, time() - tStart
+
+def sources(paths):
+    '''Expand directories into the .cmm files they contain, in sorted order'''
+
+    files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files += [ os.path.join(root, name) for name in sorted(names) \
+                           if name.endswith('.cmm') ]
+        else:
+            files.append(path)
+
+    return files
+
+def outputPath(path, outdir):
+    '''Path of the .s file for a source file'''
+
+    base = os.path.splitext(path)[0] + '.s'
+
+    if outdir != None:
+        base = os.path.join(outdir, os.path.basename(base))
+
+    return base
+
+def main(argv):
+    argparser = argparse.ArgumentParser(description = 'C-- compiler for ARM')
+    argparser.add_argument('paths', nargs = '*', metavar = 'path', \
+                           help = 'source file or directory of .cmm files')
+    argparser.add_argument('-o', dest = 'outdir', \
+                           help = 'directory for the .s files')
+    argparser.add_argument('-j', dest = 'jobs', type = int, \
+                           default = os.cpu_count(), \
+                           help = 'number of worker processes')
+    argparser.add_argument('-J', dest = 'codegenJobs', type = int, \
+                           default = 1, \
+                           help = 'processes for the functions of each file')
+    argparser.add_argument('-t', dest = 'trace', action = 'store_true', \
+                           help = 'print the generated code')
+    argparser.add_argument('-O', dest = 'optimize', type = int, default = 1, \
+                           help = 'optimization level, 0 to disable')
+    argparser.add_argument('-a', dest = 'allocator', default = 'greedy', \
+                           choices = sorted(output.allocators), \
+                           help = 'register allocator')
+    args = argparser.parse_args(argv)
+
+    if args.paths:
+        files = sources(args.paths)
+        outs = [ outputPath(path, args.outdir) for path in files ]
+    else:
+        files = [ 'examples/example.cmm' ]
+        outs = [ 'examples/output.s' ]
+
+    if args.outdir != None:
+        os.makedirs(args.outdir, exist_ok = True)
+
+    tStart = time()
+    failed = 0
+
+    if args.jobs > 1 and len(files) > 1:
+        executor = ProcessPoolExecutor(args.jobs)
+        chunksize = max(1, len(files) // (args.jobs * 4))
+        results = executor.map(compileFile, files, outs, \
+                               [ args.codegenJobs ] * len(files), \
+                               [ args.trace ] * len(files), \
+                               [ args.optimize ] * len(files), \
+                               [ args.allocator ] * len(files), \
+                               chunksize = chunksize)
+    else:
+        executor = None
+        results = map(compileFile, files, outs, \
+                      [ args.codegenJobs ] * len(files), \
+                      [ args.trace ] * len(files), \
+                      [ args.optimize ] * len(files), \
+                      [ args.allocator ] * len(files))
+
+    for path, outpath, error, seconds in results:
+        if error == None:
+            print(path, '->', outpath, '(' + '%.3f' % seconds, 'sec.)')
+        else:
+            failed += 1
+            print(path + ':', error, file = sys.stderr)
+
+    if executor != None:
+        executor.shutdown()
+
+    print('Compiled', len(files) - failed, 'of', len(files), 'files.', \
+          'Time:', time() - tStart, 'sec.')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
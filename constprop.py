@@ -0,0 +1,251 @@
+# Sparse conditional constant propagation
+
+# Works on SSA form (see ssa.py). Every variable starts at TOP, meaning
+# not known to be assigned yet, and goes down to a constant and then to
+# BOTTOM, meaning not constant. Only blocks reached through edges that may
+# be taken are evaluated.
+
+import ir
+import ssa
+
+TOP = 'TOP'
+BOTTOM = 'BOTTOM'
+
+def wrap(value):
+    '''Value as a 32 bit signed integer'''
+
+    value &= 0xffffffff
+    return value - (1 << 32) if value >> 31 else value
+
+def divide(a, b):
+    '''Integer division rounding towards zero, as in C'''
+
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+def binary(oper, a, b):
+    if oper == '+':
+        return wrap(a + b)
+    elif oper == '-':
+        return wrap(a - b)
+    elif oper == '*':
+        return wrap(a * b)
+    elif b == 0:
+        return BOTTOM
+    elif oper == '/':
+        return wrap(divide(a, b))
+    else: # '%'
+        return wrap(a - b * divide(a, b))
+
+def compare(comp, a, b):
+    if comp == '==':
+        return a == b
+    elif comp == '!=':
+        return a != b
+    elif comp == '<':
+        return a < b
+    elif comp == '<=':
+        return a <= b
+    elif comp == '>':
+        return a > b
+    else: # '>='
+        return a >= b
+
+def meet(a, b):
+    if a == TOP:
+        return b
+    elif b == TOP or a == b:
+        return a
+    else:
+        return BOTTOM
+
+def evaluate(expr, values):
+    '''Lattice value of an expression, given the values of the variables'''
+
+    if expr.etype is ir.tfloat:
+        return BOTTOM
+    elif isinstance(expr, ir.ConstExpr):
+        return expr.value
+    elif isinstance(expr, ir.ArrayExpr):
+        return BOTTOM
+    elif isinstance(expr, ir.VarExpr):
+        return values.get(expr.var, BOTTOM)
+    elif isinstance(expr, ir.InverseExpr):
+        value = evaluate(expr.expr, values)
+        return wrap(-value) if isinstance(value, int) else value
+    elif isinstance(expr, ir.BinExpr):
+        value1 = evaluate(expr.expr1, values)
+        value2 = evaluate(expr.expr2, values)
+
+        if value1 == BOTTOM or value2 == BOTTOM:
+            return BOTTOM
+        elif value1 == TOP or value2 == TOP:
+            return TOP
+        else:
+            return binary(expr.oper, value1, value2)
+    else:
+        return BOTTOM
+
+def condition(cond, values):
+    '''True, False, TOP or BOTTOM'''
+
+    if cond.expr1.etype is ir.tfloat or cond.expr2.etype is ir.tfloat:
+        return BOTTOM
+
+    value1 = evaluate(cond.expr1, values)
+    value2 = evaluate(cond.expr2, values)
+
+    if value1 == BOTTOM or value2 == BOTTOM:
+        return BOTTOM
+    elif value1 == TOP or value2 == TOP:
+        return TOP
+    else:
+        return compare(cond.comp, value1, value2)
+
+def fold(expr, values):
+    '''Expression with its constant parts replaced by ConstExpr'''
+
+    value = evaluate(expr, values)
+
+    if isinstance(value, int) and not isinstance(expr, ir.ConstExpr):
+        return ir.ConstExpr(expr.etype, value)
+    elif isinstance(expr, ir.InverseExpr):
+        expr.expr = fold(expr.expr, values)
+    elif isinstance(expr, ir.BinExpr):
+        expr.expr1 = fold(expr.expr1, values)
+        expr.expr2 = fold(expr.expr2, values)
+    elif isinstance(expr, ir.CallExpr):
+        expr.lexpr = [ fold(arg, values) for arg in expr.lexpr ]
+
+    return expr
+
+def initialValues(block, values):
+    '''Values on entry of the variables declared in block with a constant'''
+
+    stack = [ block ]
+
+    while stack:
+        for stmt in stack.pop().lstmt:
+            if isinstance(stmt, ir.Block):
+                stack.append(stmt)
+            elif isinstance(stmt, ir.Variable) and \
+                 not isinstance(stmt, ir.Array) and \
+                 isinstance(stmt.value, int) and stmt.stype is not ir.tfloat:
+                values[stmt] = wrap(stmt.value)
+
+def propagate(graph):
+    '''Fold constants, remove the branches that are never taken and the
+    blocks that are never reached'''
+
+    preds = graph.preds
+    values = { }
+    uses = { }
+
+    # Versions start at TOP. Parameters and other variables on entry are
+    # BOTTOM, unless they are declared with a constant
+
+    for block in graph.blocks:
+        for stmt in block:
+            for var in stmt.uses():
+                uses.setdefault(var, []).append((block, stmt))
+
+            if isinstance(stmt, ir.PhiStmt) or \
+               (isinstance(stmt, ir.AssignStmt) and ssa.scalar(stmt.lvalue)):
+                for var in stmt.defines():
+                    values[var] = TOP
+
+    initialValues(graph.func.block, values)
+    edges = set()
+    reached = set()
+    flow = [ (None, graph.first) ]
+    work = []
+
+    def lower(var, value):
+        if values[var] != value:
+            values[var] = value
+            work.extend(uses.get(var, ()))
+
+    def visit(block, stmt):
+        if isinstance(stmt, ir.PhiStmt):
+            value = TOP
+
+            for i, pred in enumerate(preds[block]):
+                if (pred, block) in edges:
+                    value = meet(value, values.get(stmt.args[i], BOTTOM))
+
+            lower(stmt.var, value)
+        elif isinstance(stmt, ir.AssignStmt):
+            if ssa.scalar(stmt.lvalue):
+                lower(stmt.lvalue.var, evaluate(stmt.expr, values))
+        elif isinstance(stmt, ir.Condition):
+            value = condition(stmt, values)
+
+            if value == BOTTOM:
+                flow.extend((block, child) for child in block.children)
+            elif value == True:
+                flow.append((block, block.children[0]))
+            elif value == False:
+                flow.append((block, block.children[1]))
+
+    while flow or work:
+        while flow:
+            edge = flow.pop()
+
+            if edge in edges:
+                continue
+
+            edges.add(edge)
+            block = edge[1]
+
+            if block in reached:
+                for stmt in block:
+                    if isinstance(stmt, ir.PhiStmt):
+                        visit(block, stmt)
+
+                continue
+
+            reached.add(block)
+
+            for stmt in block:
+                visit(block, stmt)
+
+            if len(block.children) == 1:
+                flow.append((block, block.children[0]))
+
+        while work:
+            block, stmt = work.pop()
+
+            if block in reached:
+                visit(block, stmt)
+
+    rewrite(graph, values, edges, reached)
+
+def rewrite(graph, values, edges, reached):
+    preds = graph.preds
+
+    for block in graph.blocks:
+        if block not in reached:
+            continue
+
+        children = [ child for child in block.children \
+                     if (block, child) in edges ]
+
+        if children and len(children) < len(block.children):
+            block.children = children
+            block[:] = [ stmt for stmt in block \
+                         if not isinstance(stmt, ir.Condition) ]
+
+        for stmt in block:
+            if isinstance(stmt, ir.AssignStmt) or \
+               isinstance(stmt, ir.ReturnStmt):
+                stmt.expr = fold(stmt.expr, values)
+            elif isinstance(stmt, ir.Condition):
+                stmt.expr1 = fold(stmt.expr1, values)
+                stmt.expr2 = fold(stmt.expr2, values)
+            elif isinstance(stmt, ir.PrintStmt):
+                stmt.lexpr = [ expr if isinstance(expr, str) else \
+                               fold(expr, values) for expr in stmt.lexpr ]
+            elif isinstance(stmt, ir.CallExpr):
+                fold(stmt, values)
+
+    ssa.realign(graph, preds)
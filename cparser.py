@@ -31,498 +31,529 @@ literals = { lexer.INTEGER: ir.tint, lexer.FLOAT: ir.tfloat, \
 expr_initials = [ lexer.ID, lexer.ARRAY, lexer.LPAREN, lexer.MINUS, \
                   lexer.INTEGER, lexer.FLOAT, lexer.CHARACTER ]
 
-def semanticError(e):
-    print('Semantic error at line', str(token0.line) + ':', e, file=sys.stderr)
+class Parser:
+    '''Recursive descent parser. Owns its token stream and symbol table'''
 
-def init(strinput):
-    '''Initialize the parser'''
-    
-    global lexgen, token0, token1
-    lexgen = lexer.lexer(strinput)
+    def __init__(self, source, kwtable = False, symtab = None):
+        '''Initialize the parser. source is anything lexer.lexer() accepts,
+        kwtable selects the keyword-table lexing mode and symtab is the symbol
+        table to fill, a new one by default'''
 
-    try:
-        token0 = token1 = next(lexgen)
-    except StopIteration:
-        print('Warning: file empty')
-        token1 = lexer.Token(lexer.NONE, None, None, None)
+        self.symtab = ir.SymbolTable() if symtab is None else symtab
+        self.func = None
 
-    nextToken()
+        if isinstance(source, str):
+            self.lexgen = iter(lexer.TokenBuffer(source, kwtable))
+        else:
+            self.lexgen = lexer.lexer(source, kwtable)
+
+        try:
+            self.token0 = self.token1 = next(self.lexgen)
+        except StopIteration:
+            print('Warning: file empty')
+            self.token0 = self.token1 = lexer.Token(lexer.NONE, None, None, \
+                                                    None)
 
-def nextToken():
-    '''Get next token from lexer'''
+        self.nextToken()
+
+    def semanticError(self, e):
+        print('Semantic error at line', str(self.token0.line) + ':', e, \
+              file=sys.stderr)
+
+    def nextToken(self):
+        '''Get next token from lexer'''
     
-    global token0, token1
-    loglexer.info(str(token0))
-    token0 = token1
+        loglexer.info('%s', self.token0)
+        self.token0 = self.token1
         
-    try:
-        token1 = next(lexgen)
-    except StopIteration:
-        token1 = lexer.Token(lexer.NONE, None, None, None)
+        try:
+            self.token1 = next(self.lexgen)
+        except StopIteration:
+            self.token1 = lexer.Token(lexer.NONE, None, None, None)
 
-def accept(tcode):
-    '''Try to accept a token. If success, gets a new token from lexer'''
+    def accept(self, tcode):
+        '''Try to accept a token. If success, gets a new token from lexer'''
     
-    if token0.code == tcode:
-        nextToken()
-        return True
-    else:
-        return False
-
-def acceptType():
-    '''Accept and return a type token. If it doesn't find it, raises an error'''
+        if self.token0.code == tcode:
+            self.nextToken()
+            return True
+        else:
+            return False
+
+    def acceptType(self):
+        '''Accept and return a type token. If it doesn't find it, raises an error'''
     
-    try:
-        stype = types[token0.code]
-    except KeyError:
-        raise SyntaxError('expected type')
+        try:
+            stype = types[self.token0.code]
+        except KeyError:
+            raise SyntaxError('expected type')
 
-    nextToken()
-    return stype
+        self.nextToken()
+        return stype
 
-def acceptComparator():
-    '''Accept and return a comparator. If it doesn't find it, raises an error'''
+    def acceptComparator(self):
+        '''Accept and return a comparator. If it doesn't find it, raises an error'''
 
-    try:
-        ctype = comp_opers[token0.code]
-    except KeyErrpr:
-        raise SyntaxError('expected comparator')
+        try:
+            ctype = comp_opers[self.token0.code]
+        except KeyError:
+            raise SyntaxError('expected comparator')
 
-    nextToken()
-    return ctype
+        self.nextToken()
+        return ctype
 
-def expect(tcode, expected):
-    '''Accept a token and get the next one. If fail, raises an error'''
+    def expect(self, tcode, expected):
+        '''Accept a token and get the next one. If fail, raises an error'''
     
-    if token0.code != tcode:
-        raise SyntaxError('expected ' + expected)
+        if self.token0.code != tcode:
+            raise SyntaxError('expected ' + expected)
 
-    nextToken()    
+        self.nextToken()    
 
-################################################################################
+    ############################################################################
 
-def program():
-    '''Axiom: parse a program and return a Program object'''
+    def program(self):
+        '''Axiom: parse a program and return a Program object'''
     
-    p = ir.Program()
+        p = ir.Program()
 
-    while not accept(lexer.NONE):
-        p.append(function())
+        while not self.accept(lexer.NONE):
+            p.append(self.function())
         
-    logger.info('<program> ::= { <function> } NONE')
-    return p
+        logger.info('<program> ::= { <function> } NONE')
+        return p
 
-def function():
-    '''Parse a function and return a Function object'''
+    def function(self):
+        '''Parse a function and return a Function object'''
 
-    global func
-    stype = acceptType()
+        stype = self.acceptType()
 
-    if token0.code != lexer.ID:
-        raise SyntaxError('expected id')
+        if self.token0.code != lexer.ID:
+            raise SyntaxError('expected id')
 
-    try:
-        func = ir.Function(token0.attrib[0], stype)
-    except ir.SemanticError as e:
-        semanticError(e)
-        func = None
+        try:
+            self.func = ir.Function(self.token0.attrib[0], stype, \
+                                        table = self.symtab)
+        except ir.SemanticError as e:
+            self.semanticError(e)
+            self.func = None
         
-    nextToken()
-    sp = len(ir.symtab)
-    expect(lexer.LPAREN, '(')
+        self.nextToken()
+        self.symtab.openScope()
+        self.expect(lexer.LPAREN, '(')
 
-    try:
-        lvars = l_declvars()
-        expect(lexer.RPAREN, ')')
-    except ir.SemanticError as e:
-        semanticError(e)
+        try:
+            lvars = self.l_declvars()
+            self.expect(lexer.RPAREN, ')')
+        except ir.SemanticError as e:
+            self.semanticError(e)
 
-        while not accept(lexer.RPAREN):
-            nextToken()
+            while not self.accept(lexer.RPAREN):
+                self.nextToken()
 
-    try:
-        b = block()
-    except ir.SemanticError as e:
-        semanticError(e)
-        n = 1
-
-        while n > 0:
-            if token0.code == lexer.LBRACE:
-                n += 1
-            elif token0.code == lexer.RBRACE:
-                n -= 1
-            nextToken()
-
-    if func != None:
-        func.lvars = lvars
-        func.block = b
-        ir.symtab.pop(sp)
+        try:
+            b = self.block()
+        except ir.SemanticError as e:
+            self.semanticError(e)
+            n = 1
+
+            while n > 0:
+                if self.token0.code == lexer.LBRACE:
+                    n += 1
+                elif self.token0.code == lexer.RBRACE:
+                    n -= 1
+                self.nextToken()
+
+        if self.func != None:
+            self.func.lvars = lvars
+            self.func.block = b
+
+        self.symtab.closeScope()
     
-    logger.info('<function> ::= LPAREN <l_declvars> RPAREN <block>')
-    return func
+        logger.info('<function> ::= LPAREN <l_declvars> RPAREN <block>')
+        return self.func
 
-def l_declvars():
-    '''Parse a list of variable declarations and return list(Variable)'''
+    def l_declvars(self):
+        '''Parse a list of variable declarations and return list(Variable)'''
     
-    lvars = []
+        lvars = []
     
-    if token0.code in types:
-        lvars.append(declvar())
+        if self.token0.code in types:
+            lvars.append(self.declvar())
 
-        while accept(lexer.COMMA):
-            lvars.append(declvar())
+            while self.accept(lexer.COMMA):
+                lvars.append(self.declvar())
 
-        logger.info('<l_declvars> ::= <declvar> { COMMA <declvar> }')
+            logger.info('<l_declvars> ::= <declvar> { COMMA <declvar> }')
 
-    else:
-        logger.info('<l_declvars> ::= ')
+        else:
+            logger.info('<l_declvars> ::= ')
         
-    return lvars
+        return lvars
 
-def declvar():
-    '''Parse a variable declaration, returns Variable or Array'''
+    def declvar(self):
+        '''Parse a variable declaration, returns Variable or Array'''
     
-    stype = acceptType()
+        stype = self.acceptType()
 
-    if token0.code == lexer.ID:
-        id_array = 1
-    elif token0.code == lexer.ARRAY:
-        id_array = 0
-        length = token0.attrib[1]
-    else:
-        raise SyntaxError('expected id or array')
-
-    name = token0.attrib[0]
-    nextToken()
-
-    if token0.code == lexer.SET:
-        nextToken()
-
-        if accept(lexer.MINUS):
-            minus = True
-        else:
-            minus = False        
-
-        if token0.code == lexer.INTEGER:
-            value = int(token0.attrib[0])
-        elif token0.code == lexer.FLOAT:
-            value = float(token0.attrib[0])
-        elif token0.code == lexer.CHARACTER:
-            value = ord(token0.attrib[0])
+        if self.token0.code == lexer.ID:
+            id_array = 1
+        elif self.token0.code == lexer.ARRAY:
+            id_array = 0
+            length = self.token0.attrib[1]
         else:
-            raise SyntaxError('expected constant')
+            raise SyntaxError('expected id or array')
+
+        name = self.token0.attrib[0]
+        self.nextToken()
+
+        if self.token0.code == lexer.SET:
+            self.nextToken()
+
+            if self.accept(lexer.MINUS):
+                minus = True
+            else:
+                minus = False        
+
+            if self.token0.code == lexer.INTEGER:
+                value = int(self.token0.attrib[0])
+            elif self.token0.code == lexer.FLOAT:
+                value = float(self.token0.attrib[0])
+            elif self.token0.code == lexer.CHARACTER:
+                value = ord(self.token0.attrib[0])
+            else:
+                raise SyntaxError('expected constant')
         
-        nextToken()
+            self.nextToken()
 
-        if minus:
-            value = -value
+            if minus:
+                value = -value
 
-        if id_array:
-            logger.info('<declvar> ::= <type> ID SET <expr>')
-            return ir.Variable(name, stype, value)
+            if id_array:
+                logger.info('<declvar> ::= <type> ID SET <expr>')
+                return ir.Variable(name, stype, value, self.symtab)
             
-        else:
-            logger.info('<declvar> ::= <type> ID [ INTEGER ] SET <expr>')
-            return ir.Array(name, stype, length, value)
+            else:
+                logger.info('<declvar> ::= <type> ID [ INTEGER ] SET <expr>')
+                return ir.Array(name, stype, length, value, self.symtab)
 
-    else:
-        if id_array:
-            logger.info('<declvar> ::= <type> ID')
-            return ir.Variable(name, stype)
         else:
-            logger.info('<declvar> ::= <type> ID [ INTEGER ]')
-            return ir.Array(name, stype, length)
-
-def block():
-    '''Parse a block and return a Block object'''
+            if id_array:
+                logger.info('<declvar> ::= <type> ID')
+                return ir.Variable(name, stype, table = self.symtab)
+            else:
+                logger.info('<declvar> ::= <type> ID [ INTEGER ]')
+                return ir.Array(name, stype, length, table = self.symtab)
+
+    def block(self):
+        '''Parse a block and return a Block object'''
     
-    lstmt = []
-    sp = len(ir.symtab)
-    expect(lexer.LBRACE, '{')
-
-    while token0.code != lexer.RBRACE:
-        try:
-            lstmt.append(stmt())
-        except ir.SemanticError as e:
-            semanticError(e)
-
-            #while not accept(lexer.SEMICOLON):
-            #    nextToken()
-
-    expect(lexer.RBRACE, '}')
-    ir.symtab.pop(sp)
-    logger.info('<block> ::= LBRACE { <stmt> } RBRACE')
-    return ir.Block(lstmt)
-
-def stmt():
-    '''Parse a statement and return a object of a subclass of Statement'''
+        lstmt = []
+        self.symtab.openScope()
+        self.expect(lexer.LBRACE, '{')
+
+        while self.token0.code != lexer.RBRACE:
+            try:
+                lstmt.append(self.stmt())
+            except ir.SemanticError as e:
+                self.semanticError(e)
+
+                #while not self.accept(lexer.SEMICOLON):
+                #    self.nextToken()
+
+        self.expect(lexer.RBRACE, '}')
+        self.symtab.closeScope()
+        logger.info('<block> ::= LBRACE { <stmt> } RBRACE')
+        return ir.Block(lstmt)
+
+    def stmt(self):
+        '''Parse a statement and return a object of a subclass of Statement'''
     
-    if token0.code == lexer.IF:
-        s = cond_stmt()
-        logger.info('<stmt> ::= <if_stmt>')
-
-    elif token0.code == lexer.WHILE:
-        s = loop_stmt()
-        logger.info('<stmt> ::= <while_stmt>')
-
-    elif token0.code == lexer.RETURN:
-        s = return_stmt()
-        logger.info('<stmt> ::= <return_stmt>')
-
-    elif token0.code == lexer.PRINT:
-        s = print_stmt()
-        logger.info('<stmt> ::= <print_stmt>')
-
-    elif token0.code == lexer.LBRACE:
-        s = block()
-        logger.info('<stmt> ::= <block>')
-
-    elif token0.code == lexer.SEMICOLON:
-        nextToken()
-        s = ir.EmptyStmt()
-        logger.info('<stmt> ::= SEMICOLON')
-
-    elif token0.code in types:
-        s = declvar();
-        expect(lexer.SEMICOLON, ';')
-        logger.info('<stmt> ::= <declvar> SEMICOLON')
-
-    elif token0.code in [ lexer.ID, lexer.ARRAY ] and token1.code == lexer.SET:
-        s = assign()
-        logger.info('<stmt> ::= <assign>')
+        if self.token0.code == lexer.IF:
+            s = self.cond_stmt()
+            logger.info('<stmt> ::= <if_stmt>')
+
+        elif self.token0.code == lexer.WHILE:
+            s = self.loop_stmt()
+            logger.info('<stmt> ::= <while_stmt>')
+
+        elif self.token0.code == lexer.RETURN:
+            s = self.return_stmt()
+            logger.info('<stmt> ::= <return_stmt>')
+
+        elif self.token0.code == lexer.PRINT:
+            s = self.print_stmt()
+            logger.info('<stmt> ::= <print_stmt>')
+
+        elif self.token0.code == lexer.LBRACE:
+            s = self.block()
+            logger.info('<stmt> ::= <block>')
+
+        elif self.token0.code == lexer.SEMICOLON:
+            self.nextToken()
+            s = ir.EmptyStmt()
+            logger.info('<stmt> ::= SEMICOLON')
+
+        elif self.token0.code in types:
+            s = self.declvar();
+            self.expect(lexer.SEMICOLON, ';')
+            logger.info('<stmt> ::= <declvar> SEMICOLON')
+
+        elif self.token0.code in [ lexer.ID, lexer.ARRAY ] and self.token1.code == lexer.SET:
+            s = self.assign()
+            logger.info('<stmt> ::= <assign>')
         
-    elif token0.code in expr_initials:
-        s = expr()
-        expect(lexer.SEMICOLON, ';')
-        logger.info('<stmt> ::= <expr> SEMICOLON')
+        elif self.token0.code in expr_initials:
+            s = self.expr()
+            self.expect(lexer.SEMICOLON, ';')
+            logger.info('<stmt> ::= <expr> SEMICOLON')
         
-    else:
-        raise SyntaxError('expected statement')
+        else:
+            raise SyntaxError('expected statement')
 
-    return s
+        return s
 
-def cond_stmt():
-    '''Parse a conditional statement and return a CondStmt object'''
+    def cond_stmt(self):
+        '''Parse a conditional statement and return a CondStmt object'''
     
-    expect(lexer.IF, 'if')
-    expect(lexer.LPAREN, '(')
-    c = cond()
-    expect(lexer.RPAREN, ')')
-    thenpart = stmt()
+        self.expect(lexer.IF, 'if')
+        self.expect(lexer.LPAREN, '(')
+        c = self.cond()
+        self.expect(lexer.RPAREN, ')')
+        thenpart = self.stmt()
 
-    if accept(lexer.ELSE):
-        elsepart = stmt()
-        logger.info('<cond_stmt> ::= IF LPAREN <cond> RPAREN <stmt> ELSE <stmt>')
+        if self.accept(lexer.ELSE):
+            elsepart = self.stmt()
+            logger.info('<cond_stmt> ::= IF LPAREN <cond> RPAREN <stmt> ELSE <stmt>')
 
-    else:
-        elsepart = None
-        logger.info('<cond_stmt> ::= IF LPAREN <cond> RPAREN <stmt>')
+        else:
+            elsepart = None
+            logger.info('<cond_stmt> ::= IF LPAREN <cond> RPAREN <stmt>')
 
-    return ir.CondStmt(c, thenpart, elsepart)
+        return ir.CondStmt(c, thenpart, elsepart)
 
-def loop_stmt():
-    '''Parse a loop statement and return a LoopStmt object'''
+    def loop_stmt(self):
+        '''Parse a loop statement and return a LoopStmt object'''
     
-    expect(lexer.WHILE, 'while')
-    expect(lexer.LPAREN, '(')
-    c = cond()
-    expect(lexer.RPAREN, ')')
-    s = stmt()
-    logger.info('<loop_stmt> ::= WHILE LPAREN <cond> RRPAREN <stmt>')
-    return ir.LoopStmt(c, s)
-
-def return_stmt():
-    '''Parse a return statement and return a ReturnStmt object'''
+        self.expect(lexer.WHILE, 'while')
+        self.expect(lexer.LPAREN, '(')
+        c = self.cond()
+        self.expect(lexer.RPAREN, ')')
+        s = self.stmt()
+        logger.info('<loop_stmt> ::= WHILE LPAREN <cond> RRPAREN <stmt>')
+        return ir.LoopStmt(c, s)
+
+    def return_stmt(self):
+        '''Parse a return statement and return a ReturnStmt object'''
     
-    expect(lexer.RETURN, 'return')
-
-    if not accept(lexer.SEMICOLON):
-        e = expr()
-        expect(lexer.SEMICOLON, ';')
-        logger.info('<return_stmt> ::= RETURN [ <expr> ] ;')
-    else:
-        e = ir.Expression(ir.tvoid)
-        logger.info('<return_stmt> ::= RETURN ;')
+        self.expect(lexer.RETURN, 'return')
+
+        if not self.accept(lexer.SEMICOLON):
+            e = self.expr()
+            self.expect(lexer.SEMICOLON, ';')
+            logger.info('<return_stmt> ::= RETURN [ <expr> ] ;')
+        else:
+            e = ir.Expression(ir.tvoid)
+            logger.info('<return_stmt> ::= RETURN ;')
     
-    return ir.ReturnStmt(e, func)
+        return ir.ReturnStmt(e, self.func)
     
-def print_stmt():
-    '''Parse a print statement and return a PrintStmt object'''
+    def print_stmt(self):
+        '''Parse a print statement and return a PrintStmt object'''
     
-    expect(lexer.PRINT, 'print')
-    expect(lexer.LPAREN, '(')
-    lexpr = l_expr_or_string()
-    expect(lexer.RPAREN, ')')
-    expect(lexer.SEMICOLON, ';')
-    logger.info('<print_stmt> ::= PRINT LPAREN <l_expr_or_string> RPAREN ;')
-    return ir.PrintStmt(lexpr)
-
-def assign():
-    '''Parse a assign statement and return an AssignStmt object'''
+        self.expect(lexer.PRINT, 'print')
+        self.expect(lexer.LPAREN, '(')
+        lexpr = self.l_expr_or_string()
+        self.expect(lexer.RPAREN, ')')
+        self.expect(lexer.SEMICOLON, ';')
+        logger.info('<print_stmt> ::= PRINT LPAREN <l_expr_or_string> RPAREN ;')
+        return ir.PrintStmt(lexpr)
+
+    def assign(self):
+        '''Parse a assign statement and return an AssignStmt object'''
     
-    if token0.code == lexer.ID:
-        var = ir.VarExpr(token0.attrib[0])
-        nextToken()
-        expect(lexer.SET, '=')
-        e = expr()
-        s = ir.AssignStmt(var, e, func)
-        expect(lexer.SEMICOLON, ';')
-        logger.info('<assign> ::= ARRAY SET <expr>')
-    elif token0.code == lexer.ARRAY:
-        var = ir.ArrayExpr(token0.attrib[0], int(token0.attrib[1]))
-        nextToken()
-        expect(lexer.SET, '=')
-        e = expr()
-        s = ir.AssignStmt(var, e, func)
-        expect(lexer.SEMICOLON, ';')
-        logger.info('<assign> ::= ID SET <expr>')
-    else:
-        raise SyntaxError('expected id')
-
-    return s
-
-def cond():
-    '''Parse a condition and return a Condition object'''
-    e1 = expr()
-    c = acceptComparator()
-    e2 = expr()
-    logger.info('<comp> ::= <expr> <comp> <expr>')
-    return ir.Condition(c, e1, e2)
+        if self.token0.code == lexer.ID:
+            var = ir.VarExpr(self.token0.attrib[0], self.symtab)
+            self.nextToken()
+            self.expect(lexer.SET, '=')
+            e = self.expr()
+            s = ir.AssignStmt(var, e, self.func)
+            self.expect(lexer.SEMICOLON, ';')
+            logger.info('<assign> ::= ARRAY SET <expr>')
+        elif self.token0.code == lexer.ARRAY:
+            var = ir.ArrayExpr(self.token0.attrib[0], \
+                               int(self.token0.attrib[1]), self.symtab)
+            self.nextToken()
+            self.expect(lexer.SET, '=')
+            e = self.expr()
+            s = ir.AssignStmt(var, e, self.func)
+            self.expect(lexer.SEMICOLON, ';')
+            logger.info('<assign> ::= ID SET <expr>')
+        else:
+            raise SyntaxError('expected id')
+
+        return s
+
+    def cond(self):
+        '''Parse a condition and return a Condition object'''
+        e1 = self.expr()
+        c = self.acceptComparator()
+        e2 = self.expr()
+        logger.info('<comp> ::= <expr> <comp> <expr>')
+        return ir.Condition(c, e1, e2)
     
-def expr():
-    '''Parse an expression and return an Expression object'''
+    def expr(self):
+        '''Parse an expression and return an Expression object'''
     
-    e = term()
+        e = self.term()
 
-    while True:
-        try:
-            oper = term_opers[token0.code]
-            nextToken()
-            e = ir.BinExpr(oper, e, term())
-        except KeyError:
-            break
+        while True:
+            try:
+                oper = term_opers[self.token0.code]
+                self.nextToken()
+                e = ir.BinExpr(oper, e, self.term())
+            except KeyError:
+                break
 
-    logger.info('<expr> ::= <term> { (+|-) <term> }')
-    return e
+        logger.info('<expr> ::= <term> { (+|-) <term> }')
+        return e
 
-def term():
-    '''Parse an expression of terms and return an Expression object'''
+    def term(self):
+        '''Parse an expression of terms and return an Expression object'''
     
-    e = factor()
+        e = self.factor()
 
-    while True:
-        try:
-            oper = factor_opers[token0.code]
-            nextToken()
-            e = ir.BinExpr(oper, e, factor())
-        except KeyError:
-            break
+        while True:
+            try:
+                oper = factor_opers[self.token0.code]
+                self.nextToken()
+                e = ir.BinExpr(oper, e, self.factor())
+            except KeyError:
+                break
 
-    logger.info('<term> ::= <factor> { (*|/|%) <factor> }')
-    return e
+        logger.info('<term> ::= <factor> { (*|/|%) <factor> }')
+        return e
 
-def factor():
-    '''Parse an expression of factor and return an Expression object'''
+    def factor(self):
+        '''Parse an expression of factor and return an Expression object'''
     
-    if accept(lexer.LPAREN):
-        e = expr()
-        expect(lexer.RPAREN, ')')
-        logger.info('<factor> ::= ( <factor> )')
+        if self.accept(lexer.LPAREN):
+            e = self.expr()
+            self.expect(lexer.RPAREN, ')')
+            logger.info('<factor> ::= ( <factor> )')
     
-    elif accept(lexer.MINUS):
-        e = ir.InverseExpr(factor())
-        logger.info('<factor> ::= - <factor>')
-
-    elif token0.code == lexer.ID:
-        if token1.code == lexer.LPAREN:
-            e = call()
-            logger.info('<factor> ::= <call>')
-        else:
-            e = ir.VarExpr(token0.attrib[0])
-            nextToken()
-            logger.info('<factor> ::= ID')
+        elif self.accept(lexer.MINUS):
+            e = ir.InverseExpr(self.factor())
+            logger.info('<factor> ::= - <factor>')
+
+        elif self.token0.code == lexer.ID:
+            if self.token1.code == lexer.LPAREN:
+                e = self.call()
+                logger.info('<factor> ::= <call>')
+            else:
+                e = ir.VarExpr(self.token0.attrib[0], self.symtab)
+                self.nextToken()
+                logger.info('<factor> ::= ID')
         
-    elif token0.code == lexer.ARRAY:
-        e = ir.ArrayExpr(token0.attrib[0], int(token0.attrib[1]))
-        nextToken()
-        logger.info('<factor> ::= ARRAY')
-
-    else:
-        try:
-            ctype = literals[token0.code]
-        except KeyError:
-            raise SyntaxError('expected factor')
+        elif self.token0.code == lexer.ARRAY:
+            e = ir.ArrayExpr(self.token0.attrib[0], \
+                               int(self.token0.attrib[1]), self.symtab)
+            self.nextToken()
+            logger.info('<factor> ::= ARRAY')
 
-        if token0.code == lexer.INTEGER:
-            value = int(token0.attrib[0])
-        elif token0.code == lexer.FLOAT:
-            value = float(token0.attrib[0])
         else:
-            value = ord(token0.attrib[0])
+            try:
+                ctype = literals[self.token0.code]
+            except KeyError:
+                raise SyntaxError('expected factor')
+
+            if self.token0.code == lexer.INTEGER:
+                value = int(self.token0.attrib[0])
+            elif self.token0.code == lexer.FLOAT:
+                value = float(self.token0.attrib[0])
+            else:
+                value = ord(self.token0.attrib[0])
             
-        nextToken()
-        e = ir.ConstExpr(ctype, value)
-        logger.info('<factor> ::= <literal>')
+            self.nextToken()
+            e = ir.ConstExpr(ctype, value)
+            logger.info('<factor> ::= <literal>')
 
-    return e
+        return e
 
-def call():
-    '''Parse a call and return a CallExpr object'''
+    def call(self):
+        '''Parse a call and return a CallExpr object'''
     
-    if token0.code != lexer.ID:
-        raise SyntaxError('expected name')
-
-    name = token0.attrib[0]
-    nextToken()
-    expect(lexer.LPAREN, '(')
-    lexpr = l_expr()
-    expect(lexer.RPAREN, ')')
-    logger.info('<call> ::= ID LPAREN <l_expr> RPAREN')
-    return ir.CallExpr(name, lexpr)
-
-def l_expr():
-    '''Parse a list of expressions and return list(Exppression)'''
+        if self.token0.code != lexer.ID:
+            raise SyntaxError('expected name')
+
+        name = self.token0.attrib[0]
+        self.nextToken()
+        self.expect(lexer.LPAREN, '(')
+        lexpr = self.l_expr()
+        self.expect(lexer.RPAREN, ')')
+        logger.info('<call> ::= ID LPAREN <l_expr> RPAREN')
+        return ir.CallExpr(name, lexpr, self.symtab)
+
+    def l_expr(self):
+        '''Parse a list of expressions and return list(Exppression)'''
     
-    lexpr = []
+        lexpr = []
     
-    if token0.code in expr_initials:
-        lexpr.append(expr())
+        if self.token0.code in expr_initials:
+            lexpr.append(self.expr())
 
-        while accept(lexer.COMMA):
-            lexpr.append(expr())
+            while self.accept(lexer.COMMA):
+                lexpr.append(self.expr())
 
-        logger.info('<l_expr> ::= <expr> { COMMA <expr> } ')
+            logger.info('<l_expr> ::= <expr> { COMMA <expr> } ')
         
-    else:
-        logger.info('<l_expr> ::= ')
+        else:
+            logger.info('<l_expr> ::= ')
 
-    return lexpr
+        return lexpr
           
-def l_expr_or_string():
-    '''Parse a list of expressions or strings and return a list'''
+    def l_expr_or_string(self):
+        '''Parse a list of expressions or strings and return a list'''
     
-    lexpr = []
+        lexpr = []
     
-    if token0.code == lexer.STRING:
-        lexpr.append(token0.attrib[0])
-        nextToken()
+        if self.token0.code == lexer.STRING:
+            lexpr.append(self.token0.attrib[0])
+            self.nextToken()
+
+        elif self.token0.code in expr_initials:
+            lexpr.append(self.expr())
+
+        else:
+            logger.info('<l_expr_or_string> ::= ')
+            return lexpr
 
-    elif token0.code in expr_initials:
-        lexpr.append(expr())
+        while self.accept(lexer.COMMA):        
+            if self.token0.code == lexer.STRING:
+                lexpr.append(self.token0.attrib[0])
+                self.nextToken()
+            else:
+                lexpr.append(self.expr())
 
-    else:
-        logger.info('<l_expr_or_string> ::= ')
+        logger.info('<l_expr_or_string> ::= (<expr>|STRING) { COMMA (<expr>|STRING) }')
         return lexpr
 
-    while accept(lexer.COMMA):        
-        if token0.code == lexer.STRING:
-            lexpr.append(token0.attrib[0])
-            nextToken()
-        else:
-            lexpr.append(expr())
+################################################################################
+
+# Module parser, for the former init() / program() interface
+
+parser = None
+
+def init(source, kwtable = False):
+    '''Initialize the module parser'''
+
+    global parser
+    parser = Parser(source, kwtable)
+
+def program():
+    '''Parse a program with the module parser'''
 
-    logger.info('<l_expr_or_string> ::= (<expr>|STRING) { COMMA (<expr>|STRING) }')
-    return lexpr
+    return parser.program()
 
 ################################################################################
     
@@ -533,8 +564,8 @@ if __name__ == '__main__':
     try:
         p = program()
     except SyntaxError as e:
-        print('Syntax error at line', token0.line, 'near <', token0.string, \
-              '>', e, file = sys.stderr)
+        print('Syntax error at line', parser.token0.line, 'near <', \
+              parser.token0.string, '>', e, file = sys.stderr)
         
     tEnd = time()
     print('Time:', tEnd - tStart, 'sec.')
@@ -0,0 +1,73 @@
+# Dead store elimination
+
+import ir
+import cfg
+import ssa
+
+def hasCall(expr):
+    '''Whether an expression calls a function'''
+
+    stack = [ expr ]
+
+    while stack:
+        expr = stack.pop()
+
+        if isinstance(expr, ir.CallExpr):
+            return True
+        elif isinstance(expr, ir.BinExpr):
+            stack.append(expr.expr1)
+            stack.append(expr.expr2)
+        elif isinstance(expr, ir.InverseExpr):
+            stack.append(expr.expr)
+
+    return False
+
+def dead(stmt, live, varnum):
+    '''Whether stmt only defines a scalar variable that is not in live'''
+
+    if isinstance(stmt, ir.PhiStmt):
+        var = stmt.var
+    elif isinstance(stmt, ir.AssignStmt) and ssa.scalar(stmt.lvalue) and \
+         not hasCall(stmt.expr):
+        var = stmt.lvalue.var
+    else:
+        return False
+
+    return not live & 1 << varnum[var]
+
+def eliminate(graph):
+    '''Remove assignments and phis whose variable is not live after them.
+    Each block is walked backwards from its liveout, and liveness is solved
+    again until nothing is removed. Returns the number of statements
+    removed'''
+
+    removed = 0
+
+    while True:
+        graph.liveness()
+        varnum = graph.varnum
+        count = 0
+
+        for block in graph.blocks:
+            live = block.liveout
+            stmts = []
+
+            for stmt in reversed(block):
+                if dead(stmt, live, varnum):
+                    count += 1
+                    continue
+
+                if isinstance(stmt, (ir.AssignStmt, ir.PhiStmt)):
+                    live &= ~cfg.bitset(stmt.defines(), varnum)
+
+                live |= cfg.bitset(stmt.uses(), varnum)
+                stmts.append(stmt)
+
+            if len(stmts) < len(block):
+                stmts.reverse()
+                block[:] = stmts
+
+        if not count:
+            return removed
+
+        removed += count
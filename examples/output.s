@@ -5,37 +5,33 @@ s1: .string "Resultado: %i\nTiempo: %lf seg.\n"
 .text
 fibonacci:
 PUSH { R12 }
+PUSH { R8 }
+MOV R8 R0
 l0:
 MOV R0 #2
-CMP R4 R0
+CMP R8 R0
 BGT l1
-B l2
+B l3
 l1:
-PUSH { R4 }
 MOV R0 #1
-SUB R0 R4 R0
-PUSH { R0 }
+SUB R0 R8 R0
 BL fibonacci
-ADD SP SP #4
-POP { R4 }
 MOV R1 R0
-PUSH { R4 }
+PUSH { R1 }
 MOV R0 #2
-SUB R0 R4 R0
-PUSH { R0 }
+SUB R0 R8 R0
 BL fibonacci
-ADD SP SP #4
-POP { R4 }
+POP { R1 }
 ADD R0 R1 R0
+POP { R8 }
 POP { R1 }
 BX R1
-B l3
-l3:
 l2:
-MOV R0 R4
+l3:
+MOV R0 R8
+POP { R8 }
 POP { R1 }
 BX R1
-B l3
 clock:
 PUSH { R12 }
 l4:
@@ -51,59 +47,46 @@ BX R1
 .global main
 main:
 PUSH { R12 }
-MOV R7 #45
+PUSH { R8 R9 }
+SUB SP SP #20
+MOV R8 #45
 l6:
-PUSH { R4 R5 R6 R7 }
-MOV R0, #s0
+MOV R0 #s0
 BL print
-ADD SP SP #4
-POP { R4 R5 R6 R7 }
-PUSH { R4 R5 R6 R7 }
 BL clock
-POP { R4 R5 R6 R7 }
-MOV R7 R0
-PUSH { R4 R5 R6 R7 }
-PUSH { R6 }
+MOV R8 R0
+LDR R0 [SP, #0]
 BL fibonacci
-ADD SP SP #4
-POP { R4 R5 R6 R7 }
-MOV R6 R0
-PUSH { R4 R5 R6 R7 }
+STR R0 [SP, #16]
 BL clock
-POP { R4 R5 R6 R7 }
 MOV R4 R0
-CMP R6 R6
-BGT l7
-B l8
 l7:
-CMP R6 R6
-BGT l7
-B l8
+LDR R0 [SP, #8]
+MOV R1 R0
+LDR R0 [SP, #12]
+CMP R1 R0
+BGT l8
+B l9
 l8:
+LDR R0 [SP, #8]
+MOV R1 R0
 MOV R0 #1
-SUB R0 R6 R0
-MOV R6 R0
+SUB R0 R1 R0
+STR R0 [SP, #8]
 B l7
 l9:
-PUSH { R4 R5 R6 R7 }
-SUB R0 R4 R7
+SUB R0 R4 R8
 MOV R1 R0
 PUSH { R0 }
-PUSH { R6 }
-MOV R0, #s1
+LDR R0 [SP, #4]
+PUSH { R0 }
+MOV R0 #s1
 BL print
-ADD SP SP #12
-POP { R4 R5 R6 R7 }
-PUSH { R4 R5 R6 R7 }
+ADD SP SP #8
 BL getchar
-POP { R4 R5 R6 R7 }
-MOV R0 #0
-MOV R1 R0
-MOV R0 #0
-ADD R0 R1 R0
-POP { R1 }
-BX R1
 MOV R0 #0
+ADD SP SP #20
+POP { R8 R9 }
 POP { R1 }
 BX R1
 .end
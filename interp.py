@@ -0,0 +1,268 @@
+# Interpreters for the intermediate representation and the generated code
+
+# They check the compiler on random programs (see benchmark.py check): a
+# function must return the same value when its graph is run before and
+# after optimization, and when its code is run with any register allocator.
+# Values are 32 bit integers, as on the target.
+
+import re
+import ir
+import regalloc
+from asm import Op
+
+class OutOfFuel(Exception):
+    '''The program ran more steps than allowed, probably in a loop that does
+    not end'''
+
+    pass
+
+def word(value):
+    '''value as a signed 32 bit integer'''
+
+    value &= 0xffffffff
+    return value - (1 << 32) if value >> 31 else value
+
+comparisons = { '==' : lambda a, b : a == b, '!=' : lambda a, b : a != b, \
+                '<' : lambda a, b : a < b, '<=' : lambda a, b : a <= b, \
+                '>' : lambda a, b : a > b, '>=' : lambda a, b : a >= b }
+
+class Interpreter:
+    '''Runs the functions of a program from their graphs, which may be in
+    SSA form: the phis of a block read the arguments of the edge it was
+    entered from. Calls to functions without a graph, like clock, return 0.
+    fuel is the number of statements that may be run, in all the calls'''
+
+    def __init__(self, graphs, fuel = 100000):
+        self.graphs = { graph.func.name : graph for graph in graphs }
+        self.fuel = fuel
+
+    def call(self, name, args):
+        graph = self.graphs.get(name)
+
+        if graph == None:
+            return 0
+
+        env = { }   # variable -> value, (array, index) -> value
+
+        for var, value in zip(graph.func.lvars, args):
+            env[var] = word(value)
+
+        for var in regalloc.initialized(graph.func.block):
+            env[var] = var.value
+
+        node = graph.first
+        prev = None
+
+        while True:
+            after = None
+            phis = [ stmt for stmt in node if isinstance(stmt, ir.PhiStmt) ]
+
+            # Phis are done at once, reading the values before all of them
+
+            if phis:
+                i = [ p is prev for p in graph.preds[node] ].index(True)
+                values = [ env.get(phi.args[i], 0) for phi in phis ]
+
+                for phi, value in zip(phis, values):
+                    env[phi.var] = value
+
+            for stmt in node:
+                self.fuel -= 1
+
+                if self.fuel < 0:
+                    raise OutOfFuel(name)
+
+                if isinstance(stmt, ir.PhiStmt):
+                    continue
+                elif isinstance(stmt, ir.AssignStmt):
+                    value = self.evaluate(stmt.expr, env)
+
+                    if isinstance(stmt.lvalue, ir.ArrayExpr):
+                        env[(stmt.lvalue.var, stmt.lvalue.index)] = value
+                    else:
+                        env[stmt.lvalue.var] = value
+                elif isinstance(stmt, ir.Condition):
+                    value1 = self.evaluate(stmt.expr1, env)
+                    value2 = self.evaluate(stmt.expr2, env)
+                    taken = comparisons[stmt.comp](value1, value2)
+                    after = node.children[0 if taken else 1]
+                elif isinstance(stmt, ir.ReturnStmt):
+                    return self.evaluate(stmt.expr, env)
+                elif isinstance(stmt, ir.PrintStmt):
+                    for expr in stmt.lexpr:
+                        if not isinstance(expr, str):
+                            self.evaluate(expr, env)
+                elif isinstance(stmt, ir.Expression):
+                    self.evaluate(stmt, env)
+
+            if after == None:
+                if not node.children:
+                    return None
+
+                after = node.children[0]
+
+            prev = node
+            node = after
+
+    def evaluate(self, expr, env):
+        if isinstance(expr, ir.ArrayExpr):
+            return env.get((expr.var, expr.index), 0)
+        elif isinstance(expr, ir.VarExpr):
+            return env.get(expr.var, 0)
+        elif isinstance(expr, ir.ConstExpr):
+            return expr.value
+        elif isinstance(expr, ir.InverseExpr):
+            return word(-self.evaluate(expr.expr, env))
+        elif isinstance(expr, ir.CallExpr):
+            return self.call(expr.func.name, [ self.evaluate(arg, env) \
+                                               for arg in expr.lexpr ])
+        elif isinstance(expr, ir.BinExpr):
+            value1 = self.evaluate(expr.expr1, env)
+            value2 = self.evaluate(expr.expr2, env)
+
+            if expr.oper == '+':
+                return word(value1 + value2)
+            elif expr.oper == '-':
+                return word(value1 - value2)
+            elif expr.oper == '*':
+                return word(value1 * value2)
+
+            raise Exception('operator ' + expr.oper + ' not implemented')
+
+        raise Exception('expression not implemented: ' + repr(expr))
+
+class Machine:
+    '''Runs generated code. A call to a label that is not defined, like
+    print, does nothing. Every call overwrites R1 to R7, so code that
+    expects a caller-saved register to survive it gets a wrong value, and
+    a function that does not restore R8 to R11 and SP raises an exception.
+    fuel is the number of instructions that may be run'''
+
+    memOperand = re.compile(r'\[(\w+), #(-?\d+)\]')
+
+    def __init__(self, text, fuel = 1000000):
+        self.code = []     # (Op, [ operand texts ])
+        self.labels = { }  # name -> index in code
+        self.fuel = fuel
+
+        for line in text.split('\n'):
+            if not line or line.startswith('.') or '.string' in line:
+                continue
+            elif line.endswith(':'):
+                self.labels[line[:-1]] = len(self.code)
+            else:
+                mnemonic, _, operands = line.partition(' ')
+                match = self.memOperand.search(operands)
+
+                if match != None:
+                    args = operands[:match.start()].split() + \
+                           [ match.groups() ]
+                else:
+                    args = operands.strip('{ }').split()
+
+                self.code.append((Op[mnemonic], args))
+
+    def call(self, name, args):
+        '''Value of a function, passing the first arguments in R0 to R3 and
+        pushing the rest, the last one first'''
+
+        self.r = [ 0 ] * 16
+        self.r[13] = 0x100000
+        self.memory = { }
+
+        for arg in reversed(args[4:]):
+            self.push(word(arg))
+
+        for i, arg in enumerate(args[:4]):
+            self.r[i] = word(arg)
+
+        self.run(self.labels[name])
+        return self.r[0]
+
+    def push(self, value):
+        self.r[13] -= 4
+        self.memory[self.r[13]] = value
+
+    def pop(self):
+        value = self.memory.get(self.r[13], 0)
+        self.r[13] += 4
+        return value
+
+    def reg(self, text):
+        return { 'SP' : 13, 'LR' : 14, 'PC' : 15 }.get(text) or int(text[1:])
+
+    def value(self, text):
+        if not text.startswith('#'):
+            return self.r[self.reg(text)]
+        elif re.match(r'#-?\d+$', text):
+            return int(text[1:])
+        else:
+            return 0    # address of a string
+
+    def address(self, mem):
+        return self.r[self.reg(mem[0])] + int(mem[1])
+
+    def run(self, pc):
+        r = self.r
+        compared = (0, 0)
+
+        while True:
+            self.fuel -= 1
+
+            if self.fuel < 0:
+                raise OutOfFuel()
+
+            op, args = self.code[pc]
+            pc += 1
+
+            if op == Op.MOV:
+                r[self.reg(args[0])] = self.value(args[1])
+            elif op == Op.ADD:
+                r[self.reg(args[0])] = word(self.value(args[1]) + \
+                                            self.value(args[2]))
+            elif op == Op.SUB:
+                r[self.reg(args[0])] = word(self.value(args[1]) - \
+                                            self.value(args[2]))
+            elif op == Op.MUL:
+                r[self.reg(args[0])] = word(self.value(args[1]) * \
+                                            self.value(args[2]))
+            elif op == Op.CMP:
+                compared = (self.value(args[0]), self.value(args[1]))
+            elif op == Op.B:
+                pc = self.labels[args[0]]
+            elif op in (Op.BEQ, Op.BLT, Op.BGT):
+                comp = { Op.BEQ : '==', Op.BLT : '<', Op.BGT : '>' }[op]
+
+                if comparisons[comp](*compared):
+                    pc = self.labels[args[0]]
+            elif op == Op.BL:
+                if args[0] in self.labels:
+                    saved = r[8:12] + [ r[13] ]
+                    self.run(self.labels[args[0]])
+
+                    if r[8:12] + [ r[13] ] != saved:
+                        raise Exception(args[0] + ' changed R8 to R11 or SP')
+
+                for i in range(1, 8):
+                    r[i] = 12345 + i
+            elif op == Op.BX:
+                return
+            elif op == Op.PUSH:
+                for reg in reversed(args):
+                    self.push(r[self.reg(reg)])
+            elif op == Op.POP:
+                for reg in args:
+                    r[self.reg(reg)] = self.pop()
+            elif op == Op.LDR:
+                r[self.reg(args[0])] = \
+                    self.memory.get(self.address(args[1]), 0)
+            elif op == Op.LDRB:
+                r[self.reg(args[0])] = \
+                    self.memory.get(self.address(args[1]), 0) & 0xff
+            elif op == Op.STR:
+                self.memory[self.address(args[1])] = r[self.reg(args[0])]
+            elif op == Op.STRB:
+                self.memory[self.address(args[1])] = \
+                    r[self.reg(args[0])] & 0xff
+            else:
+                raise Exception(op.name + ' not implemented')
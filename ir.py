@@ -3,6 +3,7 @@
 # May 19, 2014
 
 import sys
+import itertools
 
 binopers = [ '+', '-', '*', '/', '%' ]
 compopers = [ '==', '!=', '>', '>=', '<', '<=' ]
@@ -10,6 +11,11 @@ compopers = [ '==', '!=', '>', '>=', '<', '<=' ]
 class SemanticError(Exception):
     pass
 
+# Symbols are numbered in creation order, so that passes iterating over sets
+# of symbols can sort them and produce the same output in any process
+
+serials = itertools.count()
+
 ################################################################################
 
 class Type:
@@ -19,20 +25,32 @@ class Type:
 
     def __repr__(self):
         return self.tname
+
+    def __reduce__(self):
+        '''Types are compared by identity, so they unpickle to the module
+        instances, tint, tchar...'''
+
+        return 't' + self.tname
         
 class Symbol:
-    def __init__(self, name, stype):
+    def __init__(self, name, stype, table = None):
+        '''Declare the symbol in table, by default the module symtab'''
+
         self.name = name
         self.stype = stype
+        self.serial = next(serials)
+
+        if table is None:
+            table = symtab
 
-        if name in symtab:
+        if name in table:
             raise SemanticError('symbol < ' + name + ' > already in symtable')
         
-        symtab.append(self)
+        table.append(self)
 
 class Variable(Symbol):
-    def __init__(self, name, stype, value = None):
-        super().__init__(name, stype)
+    def __init__(self, name, stype, value = None, table = None):
+        super().__init__(name, stype, table)
         self.value = value
 
         if stype == tvoid:
@@ -47,8 +65,8 @@ class Variable(Symbol):
         return string
 
 class Array(Variable):
-    def __init__(self, name, stype, length, value = None):
-        super().__init__(name, stype, value)
+    def __init__(self, name, stype, length, value = None, table = None):
+        super().__init__(name, stype, value, table)
         self.length = length
 
     def __repr__(self):
@@ -60,29 +78,59 @@ class Array(Variable):
 
         return string
 
+class Version(Variable):
+    '''SSA version of a variable, declared in table with the name
+    origin.number'''
+
+    def __init__(self, origin, number, table):
+        super().__init__(origin.name + '.' + str(number), origin.stype, \
+                         None, table)
+        self.origin = origin
+
 class SymbolTable(list):
-    def __getitem__(self, key):
-        for s in self:
-            if s.name == key:
-                return s
+    '''Symbols in declaration order, indexed by name. A scope is closed by
+    popping back to the length the table had when it was opened'''
 
-        raise SemanticError('symbol < ' + key + ' > not found')
-        # raise KeyError()
+    def __init__(self):
+        super().__init__()
+        self.names = { } # name -> [ symbols in declaration order ]
+        self.marks = [ ]
 
-    def __contains__(self, item):
-        for s in self:
-            if s.name == item:
-                return True
+    def append(self, symbol):
+        super().append(symbol)
+
+        try:
+            self.names[symbol.name].append(symbol)
+        except KeyError:
+            self.names[symbol.name] = [ symbol ]
+
+    def __getitem__(self, key):
+        try:
+            return self.names[key][0]
+        except KeyError:
+            raise SemanticError('symbol < ' + key + ' > not found')
 
-        return False
+    def __contains__(self, item):
+        return item in self.names
 
     def pop(self, size):
         while len(self) > size:
-            super().pop()
+            symbol = super().pop()
+            symbols = self.names[symbol.name]
+            symbols.pop()
+
+            if not symbols:
+                del self.names[symbol.name]
+
+    def openScope(self):
+        self.marks.append(len(self))
+
+    def closeScope(self):
+        self.pop(self.marks.pop())
 
 class Function(Symbol):
-    def __init__(self, name, stype, lvars = None, block = None):
-        super().__init__(name, stype)
+    def __init__(self, name, stype, lvars = None, block = None, table = None):
+        super().__init__(name, stype, table)
         self.lvars = lvars
         self.block = block
 
@@ -197,6 +245,25 @@ class AssignStmt(Statement):
     def uses(self):
         return self.expr.uses()
 
+class PhiStmt(Statement):
+    '''var = phi(args), where args[i] comes from the i-th predecessor of the
+    block'''
+
+    def __init__(self, var, nargs):
+        self.var = var
+        self.origin = var
+        self.args = [ var ] * nargs
+
+    def __repr__(self):
+        return self.var.name + ' = phi(' + \
+               ', '.join(arg.name for arg in self.args) + ')'
+
+    def defines(self):
+        return { self.var }
+
+    def uses(self):
+        return set(self.args)
+
 class Expression(Statement):
     def __init__(self, etype):
         self.etype = etype
@@ -205,8 +272,8 @@ class Expression(Statement):
         return 'void'
 
 class VarExpr(Expression):
-    def __init__(self, name):
-        self.var = symtab[name]
+    def __init__(self, name, table = None):
+        self.var = (symtab if table is None else table)[name]
 
         if not isinstance(self.var, Variable):
             raise SemanticError('expected variable id')
@@ -220,21 +287,21 @@ class VarExpr(Expression):
         return { self.var }
 
 class ArrayExpr(VarExpr):
-    def __init__(self, name, index):
-        self.array = symtab[name]
+    def __init__(self, name, index, table = None):
+        self.array = (symtab if table is None else table)[name]
 
         if not isinstance(self.array, Array):
             raise SemanticError('expected array id')
 
-        super().__init__(name)
+        super().__init__(name, table)
         self.index = index
 
     def __repr__(self):
         return self.array.name + '[' + repr(self.index) + ']'
 
 class CallExpr(Expression):
-    def __init__(self, name, lexpr):
-        self.func = symtab[name]
+    def __init__(self, name, lexpr, table = None):
+        self.func = (symtab if table is None else table)[name]
 
         if not isinstance(self.func, Function):
             raise SemanticError('expected function id')
@@ -244,7 +311,12 @@ class CallExpr(Expression):
         self.lexpr = lexpr
 
     def uses(self):
-        return set()
+        symbols = set()
+
+        for expr in self.lexpr:
+            symbols |= expr.uses()
+
+        return symbols
 
     def __repr__(self):
         string = self.func.name + '('
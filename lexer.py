@@ -4,6 +4,9 @@
 
 import sys
 import re
+import codecs
+from array import array
+from types import MappingProxyType
 
 NONE = 0
 COMMA = 1
@@ -81,7 +84,24 @@ patterns = [ '\s+',
              '\'(\w)\'',
              '"([^"]*)"' ]
 
+COMMENT = -1
+UNCLOSED = -2
+
+CHUNKSIZE = 1 << 16
+LOOKAHEAD = 1 << 12
+
+comments = [ '//.*\n',
+             '/\*[\s\S]*?\*/' ]
+
+unclosed = '//|/\*'
+
+keywords = MappingProxyType({ 'if': IF, 'else': ELSE, 'while': WHILE, \
+                              'return': RETURN, 'print': PRINT, 'int': TINT, \
+                              'float': TFLOAT, 'char': TCHAR, 'void': TVOID })
+
 class Token:
+    __slots__ = ('code', 'attrib', 'string', 'line')
+
     def __init__(self, code, attrib, string, line):
         self.code = code
         self.attrib = attrib
@@ -92,70 +112,256 @@ class Token:
         return 'Line ' + str(self.line) + ' token ' + str(self.code) + \
                ' ' + str(self.string)
 
-def lexer(strinput):
-    '''Yields tuples (token, string, line)'''
-    
+# In keyword-table mode an identifier is matched once, with its array suffix
+# if it has one, and classified afterwards
+
+word = '([A-Za-z_]\w*)(?:\[(\d+)\])?'
+
+def compileMaster(entries):
+    '''Build one alternation of comments and the (code, pattern) entries, in
+    order. Returns the compiled regex and a table: group name -> (kind,
+    groups)'''
+
+    alternatives = []
+    table = {}
+    index = 1
+    entries = [ (COMMENT, p) for p in comments ] + [ (UNCLOSED, unclosed) ] + \
+              list(entries)
+
+    for i in range(len(entries)):
+        kind, pattern = entries[i]
+        name = 'g' + str(i)
+        ngroups = re.compile(pattern).groups
+        alternatives.append('(?P<' + name + '>' + pattern + ')')
+        table[name] = (kind, tuple(range(index + 1, index + 1 + ngroups)))
+        index += 1 + ngroups
+
+    return re.compile('|'.join(alternatives)), table
+
+master, mastertable = compileMaster(enumerate(patterns))
+
+# Without keyword patterns only identifiers can start with a letter, so word
+# can be tried first without changing which alternative matches
+
+kwmaster, kwmastertable = compileMaster([ (ID, word) ] + \
+                                        [ (code, patterns[code]) \
+                                          for code in range(len(patterns)) \
+                                          if code not in keywords.values() \
+                                          and code not in (ARRAY, ID) ])
+nonspace = re.compile('\S*')
+single = [ re.compile(p) for p in patterns ]
+
+def readChunks(source, chunksize):
+    '''Yields str chunks decoded from a binary file or mmap object, or from an
+    iterable of bytes chunks'''
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        datas = (view[i:i + chunksize] for i in range(0, len(view), chunksize))
+    elif hasattr(source, 'read'):
+        datas = iter(lambda: source.read(chunksize), source.read(0))
+    else:
+        datas = source
+
+    for data in datas:
+        chunk = data if isinstance(data, str) else decoder.decode(data)
+
+        if chunk:
+            yield chunk
+
+    chunk = decoder.decode(b'', True)
+
+    if chunk:
+        yield chunk
+
+def refill(strinput, pos, chunks):
+    '''Drop the consumed input and append the next chunk. Returns the new
+    input, position and end of file flag'''
+
+    try:
+        return strinput[pos:] + next(chunks), 0, False
+    except StopIteration:
+        return strinput[pos:], 0, True
+
+def scan(source, kwtable = False, chunksize = CHUNKSIZE):
+    '''Yields tuples (code, match, groups, end, line, offset) for each token.
+    groups are the indices of the token attributes in match, end is where the
+    token ends in match.string and offset is the position of match.string in
+    the whole input. See lexer() for the arguments'''
+
+    if isinstance(source, str):
+        strinput = source
+        eof = True
+    else:
+        chunks = readChunks(source, chunksize)
+        strinput = ''
+        eof = False
+
     pos = 0
+    offset = 0
     line = 1
     error = False
-    
-    while strinput[pos:]:
 
-        # Remove comments
-        
-        match = re.match('//', strinput[pos:])
+    if kwtable:
+        match = kwmaster.match
+        table = kwmastertable
+        kwget = dict(keywords).get
+    else:
+        match = master.match
+        table = mastertable
 
-        if match:
-            pos += match.end()
-            match = re.match('.*\n', strinput[pos:])
+    while True:
+        end = len(strinput)
 
-            if match:
-                pos += match.end()
-                line += 1
-            else:
-                print('Lexical error: line', line, 'near /*', \
-                      file = sys.stderr)
-            
+        if not eof and end - pos < LOOKAHEAD:
+            offset += pos
+            strinput, pos, eof = refill(strinput, pos, chunks)
             continue
 
-        match = re.match('/\*', strinput[pos:])
+        if pos >= end:
+            break
+
+        m = match(strinput, pos)
+
+        if not eof:
 
-        if match:
-            pos += match.end()
-            match = re.match('.*\*/', strinput[pos:], flags = re.DOTALL)
+            # A token reaching the end of the input, an unclosed comment or an
+            # unclosed string may still be completed by the next chunk
 
-            if match:
-                pos += match.end()
-                line += match.group().count('\n')
+            if m:
+                more = m.end() == end or table[m.lastgroup][0] == UNCLOSED
             else:
-                print('Lexical error: line', line, 'near /*', \
-                      file = sys.stderr)
+                more = strinput[pos] == '"' or \
+                       nonspace.match(strinput, pos).end() == end
 
-            continue
-                         
-        for i in range(len(patterns)):
-            match = re.match(patterns[i], strinput[pos:])
+            if more:
+                offset += pos
+                strinput, pos, eof = refill(strinput, pos, chunks)
+                continue
+
+        if m:
+            kind, groups = table[m.lastgroup]
+            pos = m.end()
 
-            if match:
-                pos += match.end()
+            if kind == COMMENT:
+                line += m.group().count('\n')
+            elif kind == UNCLOSED:
+                print('Lexical error: line', line, 'near /*', \
+                      file = sys.stderr)
+            else:
                 error = False
 
-                if i == NONE:
-                    line += match.group().count('\n')
+                if kind == NONE:
+                    line += m.group().count('\n')
+                elif kwtable and kind == ID:
+                    kind = kwget(m.group())
+
+                    if kind != None:
+                        yield kind, m, (), pos, line, offset
+                    elif m.group(groups[1]) == None:
+                        yield ID, m, groups[:1], pos, line, offset
+                    elif m.group(groups[0]) in keywords:
+                        pos = m.end(groups[0])
+                        yield keywords[m.group(groups[0])], m, (), pos, line, \
+                              offset
+                    else:
+                        yield ARRAY, m, groups, pos, line, offset
                 else:
-                    yield Token(i, match.groups(), match.group(), line)
+                    yield kind, m, groups, pos, line, offset
 
-                break
-            
-        if not match:
-            match = re.match('\S*', strinput[pos:])
+        else:
+            m = nonspace.match(strinput, pos)
 
             if not error:
                 error = True
-                print('Lexical error: line', line, 'near', match.group(), \
+                print('Lexical error: line', line, 'near', m.group(), \
                       file = sys.stderr)
-                
-            pos += match.end()
+
+            pos = m.end()
+
+def lexer(source, kwtable = False, chunksize = CHUNKSIZE):
+    '''Yields Token objects. source is a str, a binary file or mmap object, or
+    an iterable of bytes chunks; the last ones are read by chunks so only about
+    LOOKAHEAD characters besides the current token are kept in memory.
+    If kwtable is set, keywords are not matched as patterns: identifiers are
+    matched once and looked up in keywords, so that names like 'iffy' are not
+    split'''
+
+    for code, m, groups, end, line, offset in scan(source, kwtable, chunksize):
+        if not groups:
+            if end == m.end():
+                yield Token(code, (), m.group(), line)
+            else:
+                yield Token(code, (), m.string[m.start():end], line)
+        elif len(groups) == 1:
+            yield Token(code, (m.group(groups[0]),), m.group(), line)
+        else:
+            yield Token(code, m.group(*groups), m.group(), line)
+
+class TokenBuffer:
+    '''Whole token stream of a str source kept in parallel arrays of code, line
+    and start and end offsets. Strings and attributes are only sliced from the
+    source when they are asked for'''
+
+    def __init__(self, source, kwtable = False):
+        self.source = source
+        self.codes = array('H')
+        self.lines = array('I')
+        self.starts = array('I')
+        self.ends = array('I')
+
+        for code, m, groups, end, line, offset in scan(source, kwtable):
+            self.codes.append(code)
+            self.lines.append(line)
+            self.starts.append(m.start())
+            self.ends.append(end)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return BufferToken(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.codes)):
+            yield BufferToken(self, index)
+
+    def string(self, index):
+        return self.source[self.starts[index]:self.ends[index]]
+
+    def attrib(self, index):
+        code = self.codes[index]
+
+        if code in keywords.values():
+            return ()
+
+        return single[code].match(self.source, self.starts[index], \
+                                  self.ends[index]).groups()
+
+class BufferToken:
+    '''Token interface over an entry of a TokenBuffer'''
+
+    __slots__ = ('buffer', 'index', 'code', 'line')
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+        self.code = buffer.codes[index]
+        self.line = buffer.lines[index]
+
+    @property
+    def attrib(self):
+        return self.buffer.attrib(self.index)
+
+    @property
+    def string(self):
+        return self.buffer.string(self.index)
+
+    def __str__(self):
+        return 'Line ' + str(self.line) + ' token ' + str(self.code) + \
+               ' ' + str(self.string)
 
 if __name__ == '__main__':
     for token in lexer(open('example.cmm', 'r').read()):
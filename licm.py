@@ -0,0 +1,155 @@
+# Loop-invariant code motion
+
+# Works on SSA form, on the natural loops of cfg.Graph.loops. A computation
+# whose operands are not defined inside the loop gives the same value on
+# every iteration, so it is moved to a preheader: a new block that is the
+# only way into the loop header from outside the loop. Inner loops are done
+# first, so their preheaders can be emptied into the outer loop's one.
+
+import ir
+import cfg
+import ssa
+import valnum
+
+def invariant(expr, defined):
+    '''Whether expr always gives the same value and cannot fail, given the
+    variables defined inside the loop'''
+
+    stack = [ expr ]
+
+    while stack:
+        expr = stack.pop()
+
+        if isinstance(expr, ir.ArrayExpr) or isinstance(expr, ir.CallExpr):
+            return False
+        elif isinstance(expr, ir.VarExpr):
+            if expr.var in defined:
+                return False
+        elif isinstance(expr, ir.InverseExpr):
+            stack.append(expr.expr)
+        elif isinstance(expr, ir.BinExpr):
+            if expr.oper in ('/', '%') and \
+               not (isinstance(expr.expr2, ir.ConstExpr) and expr.expr2.value):
+                return False
+
+            stack.append(expr.expr1)
+            stack.append(expr.expr2)
+
+    return True
+
+def definitions(body):
+    defined = set()
+
+    for block in body:
+        for stmt in block:
+            if isinstance(stmt, (ir.AssignStmt, ir.PhiStmt)):
+                defined |= stmt.defines()
+
+    return defined
+
+def outside(graph, header, body):
+    '''Predecessors of the header outside the loop'''
+
+    return [ pred for pred in graph.preds[header] if pred not in body ]
+
+def preheader(graph, header, body):
+    '''New block between the header and its only predecessor outside the
+    loop'''
+
+    preds = graph.preds
+    entry = outside(graph, header, body)[0]
+    node = cfg.Node()
+    node.children = [ header ]
+    ssa.replaceChild(entry, header, node)
+    aligned = dict(preds)
+    aligned[header] = [ node if pred is entry else pred \
+                        for pred in preds[header] ]
+    aligned[node] = [ entry ]
+    ssa.realign(graph, aligned)
+    return node
+
+def hoistLoop(graph, header, body, table):
+    '''Move the invariant computations of a loop to its preheader. Returns
+    the preheader and the number of computations moved'''
+
+    blocks = [ block for block in graph.blocks if block in body ]
+    defined = definitions(blocks)
+    hoisted = []
+
+    def hoist(expr):
+        '''Expression with its invariant computations moved to temporaries'''
+
+        if valnum.computed(expr) and invariant(expr, defined):
+            temp = ir.Variable('t' + str(len(table)), expr.etype, None, table)
+            hoisted.append(ir.AssignStmt(ssa.varExpr(temp), expr, graph.func))
+            return ssa.varExpr(temp)
+        elif isinstance(expr, ir.BinExpr):
+            expr.expr1 = hoist(expr.expr1)
+            expr.expr2 = hoist(expr.expr2)
+        elif isinstance(expr, ir.InverseExpr):
+            expr.expr = hoist(expr.expr)
+        elif isinstance(expr, ir.CallExpr):
+            expr.lexpr = [ hoist(arg) for arg in expr.lexpr ]
+
+        return expr
+
+    changed = True
+
+    while changed:
+        changed = False
+
+        for block in blocks:
+            stmts = []
+
+            for stmt in block:
+                if isinstance(stmt, ir.AssignStmt) and \
+                   ssa.scalar(stmt.lvalue) and invariant(stmt.expr, defined):
+                    defined -= stmt.defines()
+                    hoisted.append(stmt)
+                    changed = True
+                    continue
+
+                if isinstance(stmt, ir.AssignStmt) or \
+                   isinstance(stmt, ir.ReturnStmt):
+                    stmt.expr = hoist(stmt.expr)
+                elif isinstance(stmt, ir.Condition):
+                    stmt.expr1 = hoist(stmt.expr1)
+                    stmt.expr2 = hoist(stmt.expr2)
+                elif isinstance(stmt, ir.PrintStmt):
+                    stmt.lexpr = [ expr if isinstance(expr, str) else \
+                                   hoist(expr) for expr in stmt.lexpr ]
+                elif isinstance(stmt, ir.CallExpr):
+                    hoist(stmt)
+
+                stmts.append(stmt)
+
+            if len(stmts) < len(block):
+                block[:] = stmts
+
+    if not hoisted:
+        return None, 0
+
+    node = preheader(graph, header, body)
+    node += hoisted
+    return node, len(hoisted)
+
+def hoistAll(graph):
+    '''Loop-invariant code motion of every loop with a single entry.
+    Returns the number of computations moved'''
+
+    loops = [ (header, set(body)) for header, body in graph.loops.items() \
+              if len(outside(graph, header, body)) == 1 ]
+    loops.sort(key = lambda loop : len(loop[1]))
+    table = ir.SymbolTable()
+    moved = 0
+
+    for header, body in loops:
+        node, count = hoistLoop(graph, header, body, table)
+        moved += count
+
+        if node != None:
+            for other, outer in loops:
+                if header in outer and outer is not body:
+                    outer.add(node)
+
+    return moved
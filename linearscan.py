@@ -0,0 +1,592 @@
+# Linear scan register allocation
+
+# After Wimmer and Mossenbock, "Optimized interval splitting in a linear
+# scan register allocator". Blocks are laid out in reverse postorder and
+# every statement gets two positions: an even one where it reads its
+# operands and the next odd one where it writes its result. The lifetime of
+# a variable is an interval, a list of position ranges, and intervals are
+# given registers in order of their start. An interval is split where its
+# register is taken by another one, and the rest waits for a free register.
+# When there is none, the intervals cheapest to keep on the stack from then
+# on, weighing their uses by loop depth, are spilled. Afterwards, every part
+# gets its own variable and copies are inserted where a variable changes
+# location, inside a block or on an edge.
+
+import ir
+import cfg
+import ssa
+import regalloc
+from bisect import bisect_left, bisect_right
+from heapq import heappush, heappop
+
+INFINITY = float('inf')
+
+class Interval:
+    '''Part of the lifetime of a variable. ranges are [start, end) lists in
+    increasing order and uses the positions where the variable is read or
+    written, with the loop weight of each one in weights. reg is None for
+    parts on the stack'''
+
+    __slots__ = ('var', 'ranges', 'uses', 'weights', 'reg', 'cursor')
+
+    def __init__(self, var):
+        self.var = var
+        self.ranges = []
+        self.uses = []
+        self.weights = []
+        self.reg = None
+        self.cursor = 0
+
+    @property
+    def start(self):
+        return self.ranges[0][0]
+
+    @property
+    def end(self):
+        return self.ranges[-1][1]
+
+    def covers(self, pos):
+        '''Whether the interval covers pos. pos must not decrease between
+        calls, nor go past the end'''
+
+        while self.ranges[self.cursor][1] <= pos:
+            self.cursor += 1
+
+        return self.ranges[self.cursor][0] <= pos
+
+    def intersection(self, other):
+        '''First position covered by both intervals, or None'''
+
+        a = self.ranges
+        b = other.ranges
+        i = self.cursor
+        j = other.cursor
+
+        while i < len(a) and j < len(b):
+            start = max(a[i][0], b[j][0])
+
+            if start < min(a[i][1], b[j][1]):
+                return start
+            elif a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
+
+        return None
+
+    def nextUse(self, pos):
+        i = bisect_left(self.uses, pos)
+        return self.uses[i] if i < len(self.uses) else INFINITY
+
+    def cost(self, pos):
+        '''Weight of the uses from pos on'''
+
+        return sum(self.weights[bisect_left(self.uses, pos):])
+
+    def split(self, pos):
+        '''Move the part from pos on to a new interval and return it'''
+
+        child = Interval(self.var)
+        ranges = self.ranges
+        i = 0
+
+        while ranges[i][1] <= pos:
+            i += 1
+
+        if ranges[i][0] < pos:
+            child.ranges = [ [ pos, ranges[i][1] ] ] + ranges[i + 1:]
+            ranges[i][1] = pos
+            del ranges[i + 1:]
+        else:
+            child.ranges = ranges[i:]
+            del ranges[i:]
+
+        k = bisect_left(self.uses, pos)
+        child.uses = self.uses[k:]
+        child.weights = self.weights[k:]
+        del self.uses[k:]
+        del self.weights[k:]
+        self.cursor = min(self.cursor, len(ranges) - 1)
+        return child
+
+class LinearScan(dict):
+    '''Map from variables to register numbers by linear scan. Variables are
+    renamed where they are split, so the graph is changed. Arrays and the
+    variables in cfg.toSpill are not allocated'''
+
+    def __init__(self, cfg, nreg):
+        self.cfg = cfg
+        self.nreg = nreg
+        self.slots = [ ]    # variables on the stack
+        cfg.liveness()
+        self.number()
+        self.build()
+        self.allocate()
+        self.resolve()
+
+    def number(self):
+        '''Positions of the blocks: a block's range starts at an even
+        position of its own, then come those of its statements. bounds
+        holds the start of every block in order, then the end of the last'''
+
+        self.order = self.cfg.postorder[::-1]
+        self.start = { }
+        self.bounds = [ 0 ]
+
+        for block in self.order:
+            self.start[block] = self.bounds[-1]
+            self.bounds.append(self.bounds[-1] + 2 * len(block) + 2)
+
+    def build(self):
+        '''Intervals of the variables, walking the blocks and statements
+        backwards'''
+
+        cfg = self.cfg
+        varnum = cfg.varnum
+        excluded = 0
+        self.intervals = [ None ] * len(cfg.vars)
+
+        for i, var in enumerate(cfg.vars):
+            if isinstance(var, ir.Array) or var in cfg.toSpill:
+                excluded |= 1 << i
+            else:
+                self.intervals[i] = Interval(var)
+
+        intervals = self.intervals
+        allowed = ~excluded
+        depths = regalloc.loopDepths(cfg)
+
+        def addRange(i, start, end):
+            ranges = intervals[i].ranges
+
+            if ranges and ranges[-1][0] <= end:
+                ranges[-1][0] = min(ranges[-1][0], start)
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([ start, end ])
+
+        # A range is added when the variable stops being live, so a variable
+        # live through many blocks costs nothing in each of them. live holds
+        # the variables with an open range, and ends where each one ends
+
+        live = 0
+        ends = { }
+
+        for block, end in zip(reversed(self.order), reversed(self.bounds)):
+            liveout = block.liveout & allowed
+            weight = regalloc.LOOP_WEIGHT ** depths[block]
+
+            for i in regalloc.indices(live & ~liveout):
+                addRange(i, end, ends[i])
+
+            for i in regalloc.indices(liveout & ~live):
+                ends[i] = end
+
+            live = liveout
+            pos = end
+
+            for stmt in reversed(block):
+                pos -= 2
+                uses = regalloc.bitset(stmt.uses(), varnum) & allowed
+
+                if isinstance(stmt, ir.AssignStmt):
+                    defs = regalloc.bitset(stmt.defines(), varnum) & allowed
+
+                    for i in regalloc.indices(defs):
+                        if live & 1 << i:
+                            addRange(i, pos + 1, ends[i])
+                        else:
+                            addRange(i, pos + 1, pos + 2)
+
+                        intervals[i].uses.append(pos + 1)
+                        intervals[i].weights.append(weight)
+
+                    live &= ~defs
+
+                for i in regalloc.indices(uses):
+                    if not live & 1 << i:
+                        ends[i] = pos + 1
+
+                    intervals[i].uses.append(pos)
+                    intervals[i].weights.append(weight)
+
+                live |= uses
+
+        for i in regalloc.indices(live):
+            addRange(i, 0, ends[i])
+
+        # Variables with an initial value are set on entry
+
+        for var in regalloc.initialized(cfg.func.block):
+            i = varnum.get(var)
+
+            if i != None and intervals[i] != None:
+                addRange(i, 0, 1)
+
+        for interval in intervals:
+            if interval != None:
+                interval.ranges.reverse()
+                interval.uses.reverse()
+                interval.weights.reverse()
+
+        # Families in declaration order, so the order of the intervals, of
+        # the splits and of the copies does not depend on the bit numbers
+
+        intervals = [ interval for interval in intervals \
+                      if interval != None and interval.ranges ]
+        intervals.sort(key = lambda interval : interval.var.serial)
+        self.families = { interval.var : [ interval ] \
+                          for interval in intervals }
+
+    def allocate(self):
+        '''Give registers to the intervals in order of their start, splitting
+        them when no register is free'''
+
+        unhandled = []
+        active = []
+        inactive = []
+        serial = 0
+
+        def push(interval):
+            nonlocal serial
+            heappush(unhandled, (interval.start, serial, interval))
+            serial += 1
+
+        def split(interval, pos):
+            child = interval.split(pos)
+            self.families[child.var].append(child)
+            return child
+
+        for family in self.families.values():
+            push(family[0])
+
+        while unhandled:
+            pos, _, current = heappop(unhandled)
+
+            for interval in list(active):
+                if interval.end <= pos:
+                    active.remove(interval)
+                elif not interval.covers(pos):
+                    active.remove(interval)
+                    inactive.append(interval)
+
+            for interval in list(inactive):
+                if interval.end <= pos:
+                    inactive.remove(interval)
+                elif interval.covers(pos):
+                    inactive.remove(interval)
+                    active.append(interval)
+
+            # Try the register that stays free for longest. If it is taken
+            # before current ends, split current there
+
+            free = [ INFINITY ] * self.nreg
+
+            for interval in active:
+                free[interval.reg] = 0
+
+            for interval in inactive:
+                if free[interval.reg]:
+                    common = interval.intersection(current)
+
+                    if common != None:
+                        free[interval.reg] = min(free[interval.reg], common)
+
+            reg = max(range(self.nreg), key = lambda r : (free[r], -r))
+
+            if free[reg] >= current.end or even(free[reg]) > current.start:
+                if free[reg] < current.end:
+                    push(split(current, even(free[reg])))
+
+                current.reg = reg
+                active.append(current)
+                continue
+
+            # All registers are taken. The register whose intervals are the
+            # cheapest to keep on the stack from pos on is taken from them,
+            # unless current is cheaper: then current is the one spilled
+
+            costs = [ 0 ] * self.nreg
+            blocking = [ [] for r in range(self.nreg) ]
+
+            for interval in active + inactive:
+                if interval in active or \
+                   interval.intersection(current) != None:
+                    costs[interval.reg] += interval.cost(pos)
+                    blocking[interval.reg].append(interval)
+
+            reg = min(range(self.nreg), key = lambda r : (costs[r], r))
+
+            if current.cost(pos) <= costs[reg]:
+                continue
+
+            current.reg = reg
+            active.append(current)
+
+            for interval in blocking[reg]:
+                if interval in active:
+                    active.remove(interval)
+                else:
+                    inactive.remove(interval)
+
+                if even(pos) > interval.start:
+                    interval = split(interval, even(pos))
+
+                interval.reg = None
+
+    def resolve(self):
+        '''Give every part of a variable its own location variable, rename
+        the statements and insert the copies between locations'''
+
+        graph = self.cfg
+        table = ir.SymbolTable()
+        self.table = table
+        self.temps = { }    # type -> stack variable to break cycles
+        locations = { }     # interval -> variable
+        self.starts = { }
+        splits = [ ]        # (position, variable number) where a part starts
+        moved = set()       # variables with more than one location
+
+        # The first part keeps the variable. Later parts with the same
+        # register share it, and so do the parts on the stack
+
+        for var, family in self.families.items():
+            family.sort(key = lambda interval : interval.start)
+            names = { family[0].reg : var }
+
+            for interval in family:
+                if interval.reg not in names:
+                    names[interval.reg] = ir.Variable('t' + str(len(table)), \
+                                                      var.stype, None, table)
+
+                locations[interval] = names[interval.reg]
+
+            if len(names) > 1:
+                moved.add(var)
+                splits += [ (interval.start, graph.varnum[var]) \
+                            for interval in family[1:] ]
+
+            for reg, loc in names.items():
+                if reg == None:
+                    self.slots.append(loc)
+                else:
+                    self[loc] = reg
+
+            self.starts[var] = [ interval.start for interval in family ]
+
+        def locate(var, pos):
+            family = self.families[var]
+            return locations[family[bisect_right(self.starts[var], pos) - 1]]
+
+        def rename(expr, pos):
+            if ssa.scalar(expr) and expr.var in moved:
+                var = locate(expr.var, pos)
+                return expr if var is expr.var else ssa.varExpr(var)
+            elif isinstance(expr, ir.BinExpr):
+                expr.expr1 = rename(expr.expr1, pos)
+                expr.expr2 = rename(expr.expr2, pos)
+            elif isinstance(expr, ir.InverseExpr):
+                expr.expr = rename(expr.expr, pos)
+            elif isinstance(expr, ir.CallExpr):
+                expr.lexpr = [ rename(arg, pos) for arg in expr.lexpr ]
+
+            return expr
+
+        movedBits = regalloc.bitset(moved, graph.varnum)
+
+        for block, pos in zip(self.order, self.bounds):
+            if not (block.gen | block.kill) & movedBits:
+                continue
+
+            for stmt in block:
+                pos += 2
+
+                if isinstance(stmt, ir.AssignStmt):
+                    stmt.expr = rename(stmt.expr, pos)
+                    stmt.lvalue = rename(stmt.lvalue, pos + 1)
+                elif isinstance(stmt, ir.ReturnStmt):
+                    stmt.expr = rename(stmt.expr, pos)
+                elif isinstance(stmt, ir.Condition):
+                    stmt.expr1 = rename(stmt.expr1, pos)
+                    stmt.expr2 = rename(stmt.expr2, pos)
+                elif isinstance(stmt, ir.PrintStmt):
+                    stmt.lexpr = [ expr if isinstance(expr, str) else \
+                                   rename(expr, pos) for expr in stmt.lexpr ]
+                elif isinstance(stmt, ir.CallExpr):
+                    rename(stmt, pos)
+
+        # Copies where a part starts inside a block, before the statement
+        # that reads it there. A part loaded from the stack that is not
+        # assigned and does not leave the block needs no store when it goes
+        # back
+
+        bounds = self.bounds
+        inside = { }    # (block number, statement index) -> [ (dst, src) ]
+
+        for var, family in self.families.items():
+            loaded = None
+
+            for prev, interval in zip(family, family[1:]):
+                pos = interval.start
+                i = bisect_right(bounds, pos) - 1
+
+                if pos & 1 or bounds[i] == pos or prev.end != pos:
+                    continue
+
+                if interval.reg != None and prev.reg == None:
+                    loaded = interval
+                elif interval.reg == None and prev is loaded and \
+                     prev.start > bounds[i] and \
+                     not any(use & 1 for use in prev.uses):
+                    continue
+
+                index = (pos - bounds[i] - 2) // 2
+                inside.setdefault((i, index), []).append( \
+                    (locations[interval], locations[prev]))
+
+        for i in sorted({ i for i, index in inside }):
+            block = self.order[i]
+            stmts = []
+
+            for index, stmt in enumerate(block):
+                stmts += self.sequence(inside.get((i, index), []))
+                stmts.append(stmt)
+
+            block[:] = stmts
+
+        # Copies on the edges where a live variable changes location, which
+        # can only happen if one of its parts starts between both ends of the
+        # edge. They go at the end of the predecessor if it has a single
+        # successor, at the start of the successor if it has a single
+        # predecessor, or else in a new block on the edge
+
+        if not splits:
+            return
+
+        splits.sort()
+        positions = [ pos for pos, i in splits ]
+        preds = graph.preds
+        added = False
+
+        for block, end in zip(self.order, bounds[1:]):
+            last = end - 1
+
+            for i, child in enumerate(block.children):
+                first = self.start[child]
+                crossed = 0
+
+                for k in range(bisect_right(positions, min(first, last)), \
+                               bisect_right(positions, max(first, last))):
+                    crossed |= 1 << splits[k][1]
+
+                crossed &= child.livein
+
+                if not crossed:
+                    continue
+
+                moves = [ (locate(var, first), locate(var, last)) \
+                          for var in sorted(graph.varset(crossed), \
+                                            key = lambda v : v.serial) ]
+                stmts = self.sequence(moves)
+
+                if not stmts:
+                    continue
+
+                if len(block.children) == 1:
+                    block += stmts
+                elif len(preds[child]) == 1 and child is not graph.first:
+                    child[:0] = stmts
+                else:
+                    node = cfg.Node()
+                    node.label = block.getLabel() + '_' + str(i)
+                    node.children = [ child ]
+                    node += stmts
+                    block.children[i] = node
+                    added = True
+
+        if added:
+            graph.invalidate()
+
+    def place(self, var):
+        return ('r', self[var]) if var in self else ('s', var)
+
+    def sequence(self, moves):
+        '''Assignments doing a list of (destination, source) copies at once.
+        A copy is done once no other one reads its destination, and cycles
+        are broken through a stack variable'''
+
+        place = self.place
+        func = self.cfg.func
+        pending = { }   # destination place -> [ destination, source ]
+        order = [ ]     # destination places, in the order of moves
+        readers = { }   # place -> destination places of the copies reading it
+        count = { }     # place -> number of pending copies reading it
+        stmts = []
+
+        for dst, src in moves:
+            target = place(dst)
+            origin = place(src)
+
+            if target != origin:
+                pending[target] = [ dst, src ]
+                order.append(target)
+                readers.setdefault(origin, []).append(target)
+                count[origin] = count.get(origin, 0) + 1
+
+        ready = [ target for target in order if target not in count ]
+        index = 0
+
+        while pending:
+            if not ready:
+
+                # Every pending copy is on a cycle. Its first source is saved
+                # in the temporary, so the copy writing it can be done
+
+                while order[index] not in pending:
+                    index += 1
+
+                src = pending[order[index]][1]
+                origin = place(src)
+                temp = self.temps.get(src.stype)
+
+                if temp == None:
+                    temp = ir.Variable('t' + str(len(self.table)), \
+                                       src.stype, None, self.table)
+                    self.temps[src.stype] = temp
+                    self.slots.append(temp)
+
+                stmts.append(ir.AssignStmt(ssa.varExpr(temp), \
+                                           ssa.varExpr(src), func))
+
+                for target in readers[origin]:
+                    if target in pending:
+                        pending[target][1] = temp
+
+                count[origin] = 0
+                ready.append(origin)
+
+            target = ready.pop()
+            dst, src = pending.pop(target)
+            stmts.append(ir.AssignStmt(ssa.varExpr(dst), ssa.varExpr(src), \
+                                       func))
+            origin = place(src)
+
+            if origin in count:
+                count[origin] -= 1
+
+                if count[origin] == 0 and origin in pending:
+                    ready.append(origin)
+
+        return stmts
+
+    def toSpill(self):
+        '''Variables to be kept on the stack, other than cfg.toSpill'''
+
+        arrays = [ var for var in self.cfg.vars if isinstance(var, ir.Array) ]
+        return sorted(arrays + self.slots, key = lambda v : v.serial)
+
+    def __call__(self):
+        return self
+
+def even(pos):
+    return pos & ~1
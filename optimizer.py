@@ -0,0 +1,38 @@
+# Optimizer
+
+# Passes take a graph in SSA form and transform it in place. The graph is
+# taken out of SSA form before code generation.
+
+import ssa
+import constprop
+import valnum
+import licm
+import deadcode
+from collections import Counter
+
+passes = [ constprop.propagate, valnum.number, licm.hoistAll, \
+           deadcode.eliminate ]
+
+def name(optpass):
+    return optpass.__module__ + '.' + optpass.__name__
+
+def optimize(graph, level = 1, passes = passes):
+    '''Run the passes over a function's graph if level > 0. SSA form is only
+    built when there are passes to run. Returns a Counter with what each
+    pass that reports a number did, like the statements it removed'''
+
+    stats = Counter()
+
+    if level < 1 or not passes:
+        return stats
+
+    ssa.construct(graph)
+
+    for optpass in passes:
+        result = optpass(graph)
+
+        if result != None:
+            stats[name(optpass)] += result
+
+    ssa.destruct(graph)
+    return stats
@@ -6,43 +6,160 @@
 # r14 <- link (ret. address)
 # r15 <- pc
 
-import logging
 import sys
+import logging
+import contextlib
 import ir
+import cfg
 import regalloc
+import linearscan
+import peephole
+from asm import Op, Instr, Imm, Mem, R, SP
+import asm
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 logger = logging.getLogger('output')
 handler = logging.StreamHandler(sys.stdout)
 handler.setFormatter(logging.Formatter('output: %(message)s'))
 logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+#logger.setLevel(logging.INFO)
 
 NREGISTERS = 8
 ARCH_BYTES = 4
 FIRST_REG = 4
+FIRST_CALLEE_SAVED = FIRST_REG + regalloc.CALLER_SAVED # R8..R11
+ARG_REGISTERS = 4   # the first arguments are passed in R0..R3
 spillVars = { } # var -> offset(sp)
 strLabels = { } # str -> label
 writtenNodes = set()
 stack = 0
-file = None
+emit = None
 regs = { }
 curNode = None
+curGraph = None
+calleeSaved = ()    # registers saved on entry to the current function
+callerSaved = ()    # registers to save around the calls of the statement
+pushed = 0          # bytes pushed since the stack frame was set up
+allocators = { 'greedy' : regalloc.Allocator, 'coloring' : regalloc.Coloring, \
+               'linearscan' : linearscan.LinearScan }
+
+class Emitter:
+    '''Collects instructions to be rendered as text at once. With trace set,
+    every instruction is also logged'''
+
+    def __init__(self, trace = False):
+        self.instrs = []
+        self.append = self.instrs.append
+
+        if trace:
+            self.emit = self.traced
+        else:
+            self.emit = self.untraced
+
+    def untraced(self, op, *args):
+        self.append(Instr(op, args))
+
+    def traced(self, op, *args):
+        instr = Instr(op, args)
+        self.append(instr)
+        logger.info('%s', instr)
+
+    def getvalue(self):
+        return asm.text(self.instrs)
+
+@contextlib.contextmanager
+def tracing(trace):
+    '''Log at the info level inside the block if trace is set. The level is
+    restored afterwards, so a later compile in the same process, like the
+    next file of a worker, is not traced'''
+
+    level = logger.level
+
+    if trace:
+        logger.setLevel(logging.INFO)
+
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+def write(graphs, path, jobs = 1, trace = False, optimize = 1, \
+          allocator = 'greedy'):
+    '''Write the program into path. If jobs > 1, functions are allocated and
+    written concurrently by that many processes; the output is the same.
+    If trace is set, the output is also logged as it is generated. With
+    optimize > 0, the peephole optimizer runs on every function. allocator
+    is the name of the register allocator, a key of allocators. Returns a
+    Counter of the instructions removed by each peephole rule'''
+
+    global emit
+    global strLabels
+    strLabels = { }
+    cfg.labelnum = 0
+    header = Emitter(trace)
+    emit = header.emit
+
+    with tracing(trace):
+        emit(Op.DIRECTIVE, '.asm')
+        labels(graphs)
+        writeStrings()
+        emit(Op.DIRECTIVE, '.text')
+
+    # Number every block now, so labels don't depend on which process
+    # writes each function
+
+    for graph in graphs:
+        for node in graph:
+            node.getLabel()
+
+    n = len(graphs)
+
+    if jobs > 1 and n > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            chunksize = max(1, n // (jobs * 4))
+            results = list(executor.map(functionText, graphs, \
+                                        [ strLabels ] * n, [ trace ] * n, \
+                                        [ optimize ] * n, [ allocator ] * n, \
+                                        chunksize = chunksize))
+    else:
+        results = [ functionText(graph, strLabels, trace, optimize, allocator) \
+                    for graph in graphs ]
 
-def write(graphs, path):
-    global file
-    file = open(path, 'w')
-    file.write('.asm\n')
-    logger.info('.asm')
-    labels(graphs)
-    writeStrings()
-    file.write('.text\n')
-    logger.info('.text')
+    texts = [ header.getvalue() ]
+    stats = Counter()
 
-    for cfg in graphs:
-        writeFunction(cfg)
-    
-    file.write('.end\n')
-    file.close()
+    for text, removed in results:
+        texts.append(text)
+        stats.update(removed)
+
+    with open(path, 'w') as file:
+        file.write(''.join(texts) + '.end\n')
+
+    return stats
+
+def functionText(graph, labels, trace = False, optimize = 1, \
+                 allocator = 'greedy'):
+    '''Allocate and write a function into a buffer. Returns its text and a
+    Counter of the instructions removed by the peephole optimizer'''
+
+    global emit
+    global strLabels
+    global writtenNodes
+    strLabels = labels
+    writtenNodes = set()
+    emitter = Emitter(trace)
+    emit = emitter.emit
+
+    with tracing(trace):
+        writeFunction(graph, allocator)
+
+    if optimize > 0:
+        removed = peephole.optimize(emitter.instrs)
+    else:
+        removed = Counter()
+
+    return emitter.getvalue(), removed
 
 def labels(graphs):
     global strlabels
@@ -57,78 +174,77 @@ def labels(graphs):
                             if not expr in strLabels:
                                 strLabels[expr] = 's' + str(labelnum)
                                 labelnum += 1
-                            logger.info(expr + ' -> ' + strLabels[expr])
+                            logger.info('%s -> %s', expr, strLabels[expr])
 
 def writeStrings():
-    file.write('.data\n')
-    logger.info('.data')
+    emit(Op.DIRECTIVE, '.data')
 
     for string in strLabels:
-        file.write(strLabels[string] + ': .string "' + string + '"\n')
-        logger.info(strLabels[string] + ': .string "' + string + '"')
+        emit(Op.STRING, strLabels[string], string)
 
-def writeFunction(cfg):
+def writeFunction(cfg, allocator = 'greedy'):
     global regs
     global spillVars
     global stack
     global curNode
+    global curGraph
+    global calleeSaved
     spillVars = { }
     toSpill = set()
+    curGraph = cfg
 
-    # Spill parameters and arrays
+    # Spill the parameters passed on the stack, and arrays
 
-    for var in cfg.func.lvars:
+    for var in cfg.func.lvars[ARG_REGISTERS:]:
         cfg.spill(var)
         toSpill.add(var)
 
     for node in cfg:
         for stmt in node:
-            for var in node.gen | node.kill:
+            for var in cfg.varset(node.gen | node.kill):
                 if isinstance(var, ir.Array):
                     cfg.spill(var)
                     toSpill.add(var)                
     
-    alloc = regalloc.Allocator(cfg, NREGISTERS)
+    alloc = allocators[allocator](cfg, NREGISTERS)
+    regs = alloc()
     toSpill = alloc.toSpill()
 
-    if len(toSpill):
-        for var in toSpill:
-            cfg.spill(var)
-            toSpill.add(var)
+    for var in toSpill:
+        cfg.spill(var)
 
-    alloc = regalloc.Allocator(cfg, NREGISTERS)
-    regs = alloc()
-    stack = spill(toSpill, cfg.func)
+    calleeSaved = tuple(reg for reg in usedRegisters() \
+                        if reg >= FIRST_CALLEE_SAVED)
+    stack = spill(sorted(toSpill, key = lambda v : v.serial), cfg.func)
+    cfg.liveness()
     
     for node in cfg:
         curNode = node
         
-        if node == cfg.first:
+        if node is cfg.first:
             if cfg.func.name == 'main':
-                file.write('.global main\n')
-                logger.info('.global main')
+                emit(Op.DIRECTIVE, '.global main')
                 
-            file.write(cfg.func.name + ':\n')
-            logger.info(cfg.func.name + ':')
-            file.write('PUSH { R12 }\n')
-            logger.info('PUSH { R12 }')
+            emit(Op.LABEL, cfg.func.name)
+            emit(Op.PUSH, (R[12],))
+
+            if calleeSaved:
+                emit(Op.PUSH, calleeSaved)
 
             if stack > 0:
-                file.write('SUB SP SP #' + str(stack) + '\n')
-                logger.info('SUB SP SP #' + str(stack) + '')
+                emit(Op.SUB, SP, SP, Imm(stack))
 
+            receiveArguments(cfg)
             initValues(cfg.func.block)
                 
         writeNode(node)
 
-        if node == cfg.last:            
+        if node is cfg.last:            
             if stack > 0:
-                file.write('ADD SP SP #' + str(stack) + '\n')
-                logger.info('ADD SP SP #' + str(stack) + '')
+                emit(Op.ADD, SP, SP, Imm(stack))
 
         if len(node.children) == 1:
-            file.write('B ' + node.children[0].getLabel() + '\n')
-            logger.info('B ' + node.children[0].getLabel() + '')
+            emit(Op.B, node.children[0].getLabel())
 
 def writeNode(node):
     global writtenNodes
@@ -137,14 +253,45 @@ def writeNode(node):
         return
     
     writtenNodes.add(node)
-    file.write(node.getLabel() + ':\n')
-    logger.info(node.getLabel() + ':')
+    emit(Op.LABEL, node.getLabel())
+
+    for stmt, live in zip(node, liveAfter(node)):
+        if regalloc.calls(stmt):
+            saveAcross(stmt, live)
 
-    for stmt in node:
         writeStatement(stmt)
 
+def liveAfter(node):
+    '''Bit sets of the variables live after each statement of node'''
+
+    varnum = curGraph.varnum
+    live = node.liveout
+    result = []
+
+    for stmt in reversed(node):
+        result.append(live)
+
+        if isinstance(stmt, ir.AssignStmt):
+            live &= ~regalloc.bitset(stmt.defines(), varnum)
+
+        live |= regalloc.bitset(stmt.uses(), varnum)
+
+    result.reverse()
+    return result
+
+def saveAcross(stmt, live):
+    '''Set callerSaved to the caller-saved registers of the variables that
+    must survive the calls in stmt'''
+
+    global callerSaved
+    live = regalloc.across(stmt, live, curGraph.varnum)
+    used = { regs[var] + FIRST_REG for var in curGraph.varset(live) \
+             if var in regs }
+    callerSaved = tuple(R[reg] for reg in sorted(used) \
+                        if reg < FIRST_CALLEE_SAVED)
+
 def writeStatement(stmt):
-    logger.info('Input: ' + str(stmt))
+    logger.info('Input: %s', stmt)
     if isinstance(stmt, ir.EmptyStmt):
         pass
     elif isinstance(stmt, ir.AssignStmt):
@@ -167,20 +314,17 @@ def writeAssignment(stmt):
 
     if stmt.lvalue.var in regs:
         regL = regs[stmt.lvalue.var] + FIRST_REG
-        file.write('MOV R' + str(regL) + ' R' + str(regR) + '\n')
-        logger.info('MOV R' + str(regL) + ' R' + str(regR) + '')
+        emit(Op.MOV, R[regL], R[regR])
     else:
-        offset = spillVars[stmt.lvalue.var]
+        offset = spillVars[stmt.lvalue.var] + pushed
         
         if isinstance(stmt.lvalue, ir.ArrayExpr):
-            offset += stmt.lvalue.index * stmt.lvalue.stype.size
-
-        if stmt.lvalue.stype == tint:
-            file.write('STR R' + str(regR) + ' [SP, #' + str(offset) + ']\n')
-            logger.info('STR R' + str(regR) + ' [SP, #' + str(offset) + ']')
-        elif stmt.lvalue.stype == tchar:
-            file.write('STRB R' + str(regR) + ' [SP, #' + str(offset) + ']\n')
-            logger.info('STRB R' + str(regR) + ' [SP, #' + str(offset) + ']')
+            offset += stmt.lvalue.index * stmt.lvalue.var.stype.size
+
+        if stmt.lvalue.var.stype == ir.tint:
+            emit(Op.STR, R[regR], Mem(SP, offset))
+        elif stmt.lvalue.var.stype == ir.tchar:
+            emit(Op.STRB, R[regR], Mem(SP, offset))
         else:
             print('Error ( ' + str(stmt) + ' ) type unimplemented.',
                   file=sys.stderr)
@@ -206,21 +350,19 @@ def writeVarExpr(stmt):
     
     if stmt.var in regs:
         reg = regs[stmt.var] + FIRST_REG
-        print(str(stmt.var) + ' -> REGISTER ' + str(reg), file=sys.stderr)
+        logger.debug('%s -> REGISTER %d', stmt.var, reg)
         return reg
     else:
-        print(str(stmt.var) + ' -> STACK ' + str(spillVars[stmt.var]), file=sys.stderr)
-        offset = spillVars[stmt.var]
+        logger.debug('%s -> STACK %d', stmt.var, spillVars[stmt.var])
+        offset = spillVars[stmt.var] + pushed
 
-        if isinstance(stmt.lvalue, ir.ArrayExpr):
-            offset += stmt.lvalue.index * stmt.lvalue.stype.size
-
-        if stmt.lvalue.stype == tint:
-            file.write('LDR R0, [SP, #' + str(offset) + ']\n')
-            logger.info('LDR R0, [SP, #' + str(offset) + ']')
-        elif stmt.lvalue.stype == tfloat:
-            file.write('LDRB R0, [SP, #' + str(offset) + ']\n')
-            logger.info('LDRB R0, [SP, #' + str(offset) + ']')
+        if isinstance(stmt, ir.ArrayExpr):
+            offset += stmt.index * stmt.var.stype.size
+
+        if stmt.var.stype == ir.tint:
+            emit(Op.LDR, R[0], Mem(SP, offset))
+        elif stmt.var.stype == ir.tchar:
+            emit(Op.LDRB, R[0], Mem(SP, offset))
         else:
             print('Error ( ' + str(stmt) + ' ) type unimplemented.',
                   file=sys.stderr)
@@ -228,60 +370,108 @@ def writeVarExpr(stmt):
         return 0
 
 def writeCallExpr(stmt):
+    global pushed
     saveRegisters()
     length = len(stmt.lexpr)
     
-    for i in range(length - 1, -1, -1):
+    for i in range(length - 1, ARG_REGISTERS - 1, -1):
         reg = writeExpression(stmt.lexpr[i])
-        file.write('PUSH { R' + str(reg) + ' }\n')
-        logger.info('PUSH { R' + str(reg) + ' }')
+        push((R[reg],))
 
-    file.write('BL ' + stmt.func.name + '\n')
-    logger.info('BL ' + stmt.func.name + '')
+    passArguments(stmt.lexpr[:ARG_REGISTERS])
+    emit(Op.BL, stmt.func.name)
 
-    if length > 0:
-        file.write('ADD SP SP #' + str(length * ARCH_BYTES) + '\n')
-        logger.info('ADD SP SP #' + str(length * ARCH_BYTES) + '')
+    if length > ARG_REGISTERS:
+        emit(Op.ADD, SP, SP, Imm((length - ARG_REGISTERS) * ARCH_BYTES))
+        pushed -= (length - ARG_REGISTERS) * ARCH_BYTES
 
     restoreRegisters()
     return 0
 
+def passArguments(args):
+    '''Put the arguments in R0..R3. Expressions are computed in R0 and R1,
+    so the last arguments are put in place first. If the first one needs
+    R1, the second one waits on the stack. If any argument makes a call,
+    which overwrites R0..R3, they all do'''
+
+    n = len(args)
+
+    if any(regalloc.calls(arg) for arg in args):
+        for i in range(n - 1, -1, -1):
+            push((R[writeExpression(args[i])],))
+
+        pop(tuple(R[:n]))
+        return
+
+    for i in range(n - 1, 0, -1):
+        reg = writeExpression(args[i])
+
+        if i == 1 and not simple(args[0]):
+            push((R[reg],))
+        elif reg != i:
+            emit(Op.MOV, R[i], R[reg])
+
+    if n > 0:
+        reg = writeExpression(args[0])
+
+        if reg != 0:
+            emit(Op.MOV, R[0], R[reg])
+
+        if n > 1 and not simple(args[0]):
+            pop((R[1],))
+
 def writeConstExpr(stmt):
     if (stmt.etype == ir.tfloat):
-        print('Error: float constants not implemented.', file.sys.stderr)
+        print('Error: float constants not implemented.', file = sys.stderr)
         return 0
     
-    file.write('MOV R0 #' + str(stmt.value) + '\n')
-    logger.info('MOV R0 #' + str(stmt.value) + '')
+    emit(Op.MOV, R[0], Imm(stmt.value))
     return 0
 
 def writeInverseExpr(stmt):
     reg = writeExpression(stmt.expr)
-    file.write('MOV R1 #0\nMOV R0 R1 R' + str(reg) + '\n')
-    logger.info('MOV R1 #0\nMOV R0 R1 R' + str(reg) + '')
+    emit(Op.MOV, R[1], Imm(0))
+    emit(Op.SUB, R[0], R[1], R[reg])
     return 0
 
-def writeBinExpr(stmt):
-    reg1 = writeExpression(stmt.expr1)
+def writeOperands(expr1, expr2):
+    '''Compute two operands, returning their registers. The first one is
+    moved to R1 if it was computed in R0'''
+
+    reg1 = writeExpression(expr1)
 
     if reg1 == 0:
-        file.write('MOV R1 R0\n')
-        logger.info('MOV R1 R0')
+        emit(Op.MOV, R[1], R[0])
         reg1 = 1
-        
-    reg2 = writeExpression(stmt.expr2)
+
+    # R1 is kept on the stack while the second operand is computed, if that
+    # needs R1 or makes a call, which may overwrite it
+
+    if reg1 == 1 and not simple(expr2):
+        push((R[1],))
+        reg2 = writeExpression(expr2)
+        pop((R[1],))
+    else:
+        reg2 = writeExpression(expr2)
+
+    return reg1, reg2
+
+def simple(expr):
+    '''Whether computing expr leaves R1 alone'''
+
+    return isinstance(expr, ir.VarExpr) or isinstance(expr, ir.ConstExpr)
+
+def writeBinExpr(stmt):
+    reg1, reg2 = writeOperands(stmt.expr1, stmt.expr2)
 
     if stmt.oper == '+':
-        file.write('ADD R0 R' + str(reg1) + ' R' + str(reg2) + '\n')
-        logger.info('ADD R0 R' + str(reg1) + ' R' + str(reg2) + '')
+        emit(Op.ADD, R[0], R[reg1], R[reg2])
         return 0
     elif stmt.oper == '-':
-        file.write('SUB R0 R' + str(reg1) + ' R' + str(reg2) + '\n')
-        logger.info('SUB R0 R' + str(reg1) + ' R' + str(reg2) + '')
+        emit(Op.SUB, R[0], R[reg1], R[reg2])
         return 0
     elif stmt.oper == '*':
-        file.write('MUL R0 R' + str(reg1) + ' R' + str(reg2) + '\n')
-        logger.info('MUL R0 R' + str(reg1) + ' R' + str(reg2) + '')
+        emit(Op.MUL, R[0], R[reg1], R[reg2])
         return 0
     else:
         print('Error: operand not implemented.', file=sys.stderr)
@@ -289,82 +479,68 @@ def writeBinExpr(stmt):
     return 0
     
 def writeCondition(stmt):
-    reg1 = writeExpression(stmt.expr1)
+    reg1, reg2 = writeOperands(stmt.expr1, stmt.expr2)
 
-    if reg1 == 0:
-        file.write('MOV R1 R0\n')
-        logger.info('MOV R1 R0')
-        reg1 = 1
-
-    reg2 = writeExpression(stmt.expr2)
+    # Add to a scratch register, not to the variable's own one
 
     if stmt.comp == '<=':
-        file.write('ADD R' + str(reg2) + ' R' + str(reg2) + ' #1\n')
-        logger.info('ADD R' + str(reg2) + ' R' + str(reg2) + ' #1')
+        emit(Op.ADD, R[0], R[reg2], Imm(1))
+        reg2 = 0
     elif stmt.comp == '>=':
-        file.write('ADD R' + str(reg1) + ' R' + str(reg1) + ' #1\n')
-        logger.info('ADD R' + str(reg1) + ' R' + str(reg1) + ' #1')
+        emit(Op.ADD, R[1], R[reg1], Imm(1))
+        reg1 = 1
 
-    file.write('CMP R' + str(reg1) + ' R' + str(reg2) + '\n')
-    logger.info('CMP R' + str(reg1) + ' R' + str(reg2) + '')
+    emit(Op.CMP, R[reg1], R[reg2])
 
     if stmt.comp == '==':
-        file.write('BEQ ' + curNode.children[0].getLabel() + '\n')
-        file.write('B ' + curNode.children[1].getLabel() + '\n')
-        logger.info('BEQ ' + curNode.children[0].getLabel() + '')
-        logger.info('B ' + curNode.children[1].getLabel() + '')
+        emit(Op.BEQ, curNode.children[0].getLabel())
+        emit(Op.B, curNode.children[1].getLabel())
     if stmt.comp == '!=':
-        file.write('BEQ ' + curNode.children[1].getLabel() + '\n')
-        file.write('B ' + curNode.children[0].getLabel() + '\n')
-        logger.info('BEQ ' + curNode.children[1].getLabel() + '')
-        logger.info('B ' + curNode.children[0].getLabel() + '')
+        emit(Op.BEQ, curNode.children[1].getLabel())
+        emit(Op.B, curNode.children[0].getLabel())
     if stmt.comp == '<' or stmt.comp == '<=':
-        file.write('BLT ' + curNode.children[0].getLabel() + '\n')
-        file.write('B ' + curNode.children[1].getLabel() + '\n')
-        logger.info('BLT ' + curNode.children[0].getLabel() + '')
-        logger.info('B ' + curNode.children[1].getLabel() + '')
+        emit(Op.BLT, curNode.children[0].getLabel())
+        emit(Op.B, curNode.children[1].getLabel())
     if stmt.comp == '>' or stmt.comp == '>=':
-        file.write('BGT ' + curNode.children[0].getLabel() + '\n')
-        file.write('B ' + curNode.children[1].getLabel() + '\n')
-        logger.info('BGT ' + curNode.children[0].getLabel() + '')
-        logger.info('B ' + curNode.children[1].getLabel() + '')
+        emit(Op.BGT, curNode.children[0].getLabel())
+        emit(Op.B, curNode.children[1].getLabel())
 
 def writeReturn(stmt):
     global stack
     reg = writeExpression(stmt.expr)
 
     if reg != 0:
-        file.write('MOV R0 R' + str(reg) + '\n')
-        logger.info('MOV R0 R' + str(reg) + '')
+        emit(Op.MOV, R[0], R[reg])
 
     if stack > 0:
-        file.write('ADD SP SP #' + str(stack) + '\n')
-        logger.info('ADD SP SP #' + str(stack) + '')
+        emit(Op.ADD, SP, SP, Imm(stack))
+
+    if calleeSaved:
+        emit(Op.POP, calleeSaved)
         
-    file.write('POP { R1 }\nBX R1\n')
-    logger.info('POP { R1 }\nBX R1')
+    emit(Op.POP, (R[1],))
+    emit(Op.BX, R[1])
 
 def writePrint(stmt):
+    global pushed
     print('Warning: print not implemented.', file=sys.stderr)
     
     saveRegisters()
-    length = len(stmt.lexpr)
+    length = 0
     
-    for i in range(length - 1, -1, -1):
+    for i in range(len(stmt.lexpr) - 1, -1, -1):
         if isinstance(stmt.lexpr[i], str):
-            file.write('MOV R0, #' + strLabels[stmt.lexpr[i]] + '\n')
-            logger.info('MOV R0, #' + strLabels[stmt.lexpr[i]])
+            emit(Op.MOV, R[0], Imm(strLabels[stmt.lexpr[i]]))
         else:
             reg = writeExpression(stmt.lexpr[i])
-            file.write('PUSH { R' + str(reg) + ' }\n')
-            logger.info('PUSH { R' + str(reg) + ' }')
+            push((R[reg],))
+            length += 1
 
-    file.write('BL print\n')
-    logger.info('BL print')
+    emit(Op.BL, 'print')
 
     if length > 0:
-        file.write('ADD SP SP #' + str(length * ARCH_BYTES) + '\n')
-        logger.info('ADD SP SP #' + str(length * ARCH_BYTES) + '')
+        emit(Op.ADD, SP, SP, Imm(length * ARCH_BYTES))
+        pushed -= length * ARCH_BYTES
 
     restoreRegisters()
     return 0
@@ -376,26 +552,42 @@ def spill(toSpill, func):
 
     for var in toSpill:
         if isinstance(var, ir.Array):
-            stack += var.stype.size * var.length
+            stack += var.stype.size * int(var.length)
         else:
             stack += var.stype.size
 
     for var in toSpill:
         if isinstance(var, ir.Array):
-            offset += var.stype.size * var.length
+            offset += var.stype.size * int(var.length)
         else:
             offset += var.stype.size
 
         spillVars[var] = stack - offset
 
-    offset = stack + 4
+    offset = stack + 4 + len(calleeSaved) * ARCH_BYTES
     
-    for var in func.lvars:
+    for var in func.lvars[ARG_REGISTERS:]:
         spillVars[var] = offset
-        offset = var.stype.size
+        offset += ARCH_BYTES
 
     return stack
 
+def receiveArguments(cfg):
+    '''Move the parameters passed in R0..R3 to their locations, if they are
+    live on entry'''
+
+    live = cfg.varset(cfg.first.livein)
+
+    for i, var in enumerate(cfg.func.lvars[:ARG_REGISTERS]):
+        if var not in live:
+            continue
+        elif var in regs:
+            emit(Op.MOV, R[regs[var] + FIRST_REG], R[i])
+        elif var.stype == ir.tint:
+            emit(Op.STR, R[i], Mem(SP, spillVars[var]))
+        else: # ir.tchar
+            emit(Op.STRB, R[i], Mem(SP, spillVars[var]))
+
 def initValues(block):
     for stmt in block.lstmt:
         if isinstance(stmt, ir.Variable) and not isinstance(stmt, ir.Array):
@@ -403,42 +595,39 @@ def initValues(block):
                 if stmt.stype == ir.tfloat:
                     print('Warning: float not implemented.', file = sys.stderr)
                 elif stmt in regs:
-                    file.write('MOV R' + str(regs[stmt] + FIRST_REG) + \
-                               ' #' + str(stmt.value) + '\n')
-                    logger.info('MOV R' + str(regs[stmt] + FIRST_REG) + \
-                               ' #' + str(stmt.value))
+                    emit(Op.MOV, R[regs[stmt] + FIRST_REG], Imm(stmt.value))
                 elif stmt in spillVars:
-                    file.write('MOV R0 #' + str(stmt.value) + '\n')
-                    logger.info('MOV R0 #' + str(stmt.value))
+                    emit(Op.MOV, R[0], Imm(stmt.value))
                     offset = spillVars[stmt]
                     
                     if stmt.stype == ir.tint:
-                        file.write('STR R0 [SP, #' + str(offset) + ']\n')
-                        logger.info('STR R0 [SP, #' + str(offset) + ']')
+                        emit(Op.STR, R[0], Mem(SP, offset))
                     else: # ir.tchar
-                        file.write('STRB R0 [SP, #' + str(offset) + ']\n')
-                        logger.info('STRB R0 [SP, #' + str(offset) + ']')
+                        emit(Op.STRB, R[0], Mem(SP, offset))
         elif isinstance(stmt, ir.Block):
             initValues(stmt)
                     
-def saveRegisters():
-    if len(regs):
-        instr = 'PUSH {'
+def usedRegisters():
+    '''Registers given to variables, once each even if shared'''
 
-        for reg in regs:
-            instr += ' R' + str(regs[reg] + FIRST_REG)
+    return tuple(R[reg + FIRST_REG] for reg in sorted(set(regs.values())))
 
-        instr += ' }'
-        file.write(instr + '\n')
-        logger.info(instr)
-    
-def restoreRegisters():
-    if len(regs):
-        instr = 'POP {'
+def push(registers):
+    '''PUSH, keeping track of the stack pointer for the stack operands'''
 
-        for reg in regs:
-            instr += ' R' + str(regs[reg] + FIRST_REG)
+    global pushed
+    emit(Op.PUSH, registers)
+    pushed += len(registers) * ARCH_BYTES
 
-        instr += ' }'
-        file.write(instr + '\n')
-        logger.info(instr)
+def pop(registers):
+    global pushed
+    emit(Op.POP, registers)
+    pushed -= len(registers) * ARCH_BYTES
+
+def saveRegisters():
+    if callerSaved:
+        push(callerSaved)
+    
+def restoreRegisters():
+    if callerSaved:
+        pop(callerSaved)
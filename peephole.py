@@ -0,0 +1,155 @@
+# Peephole optimizer
+
+# A rule is a function rule(instrs, i) that looks at the instructions
+# starting at instrs[i] and returns None, or (n, replacement) to replace the
+# n instructions at i with the list replacement.
+
+from collections import Counter
+from asm import Op, Instr, Reg, Mem, SP, branches
+
+WINDOW = 3  # Longest pattern: step back this much after a change
+barriers = { Op.LABEL, Op.DIRECTIVE, Op.STRING, Op.BL, Op.BX } | branches
+arith = { Op.MOV, Op.ADD, Op.SUB, Op.MUL, Op.LDR, Op.LDRB }
+
+def reads(instr):
+    '''Set of registers read by an instruction'''
+
+    op = instr.op
+    args = instr.args
+
+    if op in arith:
+        regs = set(args[1:])
+    elif op in (Op.CMP, Op.STR, Op.STRB):
+        regs = set(args)
+    elif op == Op.PUSH:
+        return set(args[0]) | { SP }
+    elif op == Op.POP:
+        return { SP }
+    else:
+        return set()
+
+    for arg in list(regs):
+        if isinstance(arg, Mem):
+            regs.add(arg.base)
+
+    return { arg for arg in regs if isinstance(arg, Reg) }
+
+def writes(instr):
+    '''Set of registers written by an instruction'''
+
+    if instr.op in arith:
+        return { instr.args[0] }
+    elif instr.op == Op.POP:
+        return set(instr.args[0]) | { SP }
+    elif instr.op == Op.PUSH:
+        return { SP }
+    else:
+        return set()
+
+def overwrites(instr, reg):
+    '''Whether instr sets reg without reading it first'''
+
+    return instr.op not in barriers and reg in writes(instr) and \
+           not reg in reads(instr)
+
+def selfMove(instrs, i):
+    '''MOV Rx Rx'''
+
+    instr = instrs[i]
+
+    if instr.op == Op.MOV and instr.args[0] == instr.args[1]:
+        return 1, []
+
+def deadMove(instrs, i):
+    '''MOV Rx ... whose value is overwritten by the next instruction'''
+
+    if i + 1 < len(instrs) and instrs[i].op == Op.MOV and \
+       overwrites(instrs[i + 1], instrs[i].args[0]):
+        return 1, []
+
+def moveBack(instrs, i):
+    '''MOV Ra Rb; MOV Rb Ra: the second one does nothing'''
+
+    if i + 1 < len(instrs):
+        first, second = instrs[i], instrs[i + 1]
+
+        if first.op == second.op == Op.MOV and \
+           isinstance(first.args[1], Reg) and \
+           first.args[0] == second.args[1] and \
+           first.args[1] == second.args[0]:
+            return 2, [first]
+
+def forwardMove(instrs, i):
+    '''MOV Ra X; MOV Rb Ra; and Ra is reloaded next: MOV Rb X'''
+
+    if i + 2 < len(instrs):
+        first, second = instrs[i], instrs[i + 1]
+
+        if first.op == second.op == Op.MOV and \
+           second.args[1] == first.args[0] and \
+           overwrites(instrs[i + 2], first.args[0]):
+            return 2, [Instr(Op.MOV, (second.args[0], first.args[1]))]
+
+def pushPop(instrs, i):
+    '''PUSH { regs }; POP { regs } does nothing. PUSH { Ra }; POP { Rb } is
+    MOV Rb Ra'''
+
+    if i + 1 < len(instrs):
+        first, second = instrs[i], instrs[i + 1]
+
+        if first.op == Op.PUSH and second.op == Op.POP:
+            if first.args == second.args:
+                return 2, []
+            elif len(first.args[0]) == len(second.args[0]) == 1:
+                return 2, [Instr(Op.MOV, (second.args[0][0], first.args[0][0]))]
+
+def branchNext(instrs, i):
+    '''B to a label that follows it, with only labels in between'''
+
+    if instrs[i].op == Op.B:
+        target = instrs[i].args[0]
+        j = i + 1
+
+        while j < len(instrs) and instrs[j].op == Op.LABEL:
+            if instrs[j].args[0] == target:
+                return 1, []
+
+            j += 1
+
+def unreachable(instrs, i):
+    '''Code after B or BX that no label leads to'''
+
+    if i + 1 < len(instrs) and instrs[i].op in (Op.B, Op.BX) and \
+       instrs[i + 1].op not in (Op.LABEL, Op.DIRECTIVE, Op.STRING):
+        return 2, [instrs[i]]
+
+rules = [ unreachable, branchNext, selfMove, moveBack, forwardMove,
+          deadMove, pushPop ]
+
+def optimize(instrs, ruleset = None, stats = None):
+    '''Apply the rules to a list of instructions, in place, until none
+    matches. Adds the instructions removed by each rule to stats, a Counter,
+    and returns it'''
+
+    if ruleset == None:
+        ruleset = rules
+
+    if stats == None:
+        stats = Counter()
+
+    i = 0
+
+    while i < len(instrs):
+        for rule in ruleset:
+            match = rule(instrs, i)
+
+            if match != None:
+                n, replacement = match
+                instrs[i:i + n] = replacement
+                stats[rule.__name__] += n - len(replacement)
+                i = max(0, i - WINDOW)
+                break
+        else:
+            i += 1
+
+    return stats
@@ -4,6 +4,8 @@
 
 import logging
 import sys
+import ir
+import ssa
 
 logger = logging.getLogger('regalloc')
 handler = logging.StreamHandler(sys.stdout)
@@ -11,110 +13,438 @@ handler.setFormatter(logging.Formatter('regalloc: %(message)s'))
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
-class NotEnoughRegsException(Exception):
-	pass
+LOOP_WEIGHT = 10    # times a loop is assumed to run, for the spill costs
+CALLER_SAVED = 4    # registers 0..3 are saved by the caller, the rest by the
+                    # callee
 
 class Allocator(dict):
+    '''Greedy allocator, mapping variables to register numbers. Variables
+    that appear in the same block, accessed in it or live through it, get
+    different registers. Where a block needs more than nreg registers, the
+    variables cheapest to keep on the stack are spilled, and so is a
+    variable left without a register. Arrays and the variables in
+    cfg.toSpill are not allocated'''
+
     def __init__(self, cfg, nreg):
         self.cfg = cfg
         self.nreg = nreg
         self.toAlloc = {}
+        self.spilled = []
         cfg.liveness()
+        excluded = { var for var in cfg.vars \
+                     if isinstance(var, ir.Array) or var in cfg.toSpill }
 
         for block in cfg:
-            accessVars = block.gen | block.kill
-            crossVars = (block.livein | block.liveout) - accessVars
+            accessVars = cfg.varset(block.gen | block.kill) - excluded
+            crossVars = cfg.varset(block.livein | block.liveout) - \
+                        excluded - accessVars
             self.toAlloc[block] = [accessVars, crossVars]
 
-        allVars = [self.toAlloc[block][0] | self.toAlloc[block][1] \
-                   for bb in self.toAlloc]
-        
-        allVars2 = set()
+        # Variables with an initial value are set on entry
 
-        for v in allVars:
-            allVars2 |= v
+        self.toAlloc[cfg.first][0] |= { var for var in \
+                                         initialized(cfg.func.block) \
+                                         if var in cfg.varnum } - excluded
+        self.toAlloc[cfg.first][1] -= self.toAlloc[cfg.first][0]
+        self.costs = spillCosts(cfg)
+        self.across = cfg.varset(acrossCalls(cfg))
+        self.vars = { }
+        self.blocks = { }   # variable -> blocks where it appears
 
-        allVars = allVars2
-        self.vars = { v : None for v in allVars }
-        varFreq = { v : len([bb for bb in self.toAlloc \
-                             if v in self.toAlloc[bb][0] \
-                             or v in self.toAlloc[bb][1]]) for v in self.vars }
-        self.varFreq = sorted(varFreq, key=lambda v : varFreq[v], reverse=True)
+        for block in self.toAlloc:
+            for v in self.toAlloc[block][0] | self.toAlloc[block][1]:
+                self.vars[v] = None
+                self.blocks.setdefault(v, []).append(block)
 
-    def toSpill(self):
-        return [block for block in self.toAlloc if \
-                len(self.toAlloc[block][0]) + \
-                len(self.toAlloc[block][1]) > self.nreg]
+        # Hot variables first, so they are the last ones to be spilled
 
-    def replace(self, var, reg):
-        for block in self.toAlloc:
-            if var in self.toAlloc[block][0]:
-                self.toAlloc[block][0].remove(var)
-                self.toAlloc[block][0].add(reg)
-            if var in self.toAlloc[block][1]:
-                self.toAlloc[block][1].remove(var)
-                self.toAlloc[block][1].add(reg)
+        self.varFreq = sorted(self.vars, key = lambda v : (-self.cost(v), \
+                                                           v.serial))
 
-        self.vars[var] = reg
+    def toSpill(self):
+        '''Variables to be kept on the stack, other than cfg.toSpill'''
+
+        arrays = [ var for var in self.cfg.vars if isinstance(var, ir.Array) ]
+        return sorted(arrays + self.spilled, key = lambda v : v.serial)
 
-    def usedRegs(self):
-        return set([self.vars[v] for v in self.vars])
+    def cost(self, var):
+        return self.costs.get(var, 0)
 
-    def nextFreeReg(self):
-        u = self.usedRegs()
+    def spill(self, var):
+        for block in self.blocks.pop(var):
+            self.toAlloc[block][0].discard(var)
+            self.toAlloc[block][1].discard(var)
 
-        for i in range(self.nreg):
-            if i not in u:
-                return i
+        del self.vars[var]
+        self.spilled.append(var)
 
-        raise NotEnoughRegsException('Not enough registers')
+    def reduce(self):
+        '''Spill the cheapest variables of every block that needs more than
+        nreg registers'''
 
-    def checkInterference(self, reg):
         for block in self.toAlloc:
-            if reg in self.toAlloc[block][0] or reg in self.toAlloc[block][1]:
-                return True
+            theVars = self.toAlloc[block][0] | self.toAlloc[block][1]
 
-        return False
+            for v in sorted(theVars, key = lambda v : (self.cost(v), \
+                                                       v.serial)):
+                if len(theVars) <= self.nreg:
+                    break
+
+                theVars.remove(v)
+                self.spill(v)
 
     def getNonInterfering(self, var):
+        '''Registers not given to the variables in the blocks of var, in
+        order of preference'''
+
         interfering = set()
 
-        for block in self.toAlloc:
-            theVars = self.toAlloc[block][0] | self.toAlloc[block][1]
+        for block in self.blocks[var]:
+            for v in self.toAlloc[block][0] | self.toAlloc[block][1]:
+                interfering.add(self.vars[v])
+
+        return [ reg for reg in preference(self.nreg, var in self.across) \
+                 if reg not in interfering ]
+
+    def __call__(self):
+        self.reduce()
+
+        for v in self.varFreq:
+            if v in self.vars:
+                candidateRegs = self.getNonInterfering(v)
+
+                if len(candidateRegs):
+                    self.vars[v] = candidateRegs[0]
+                else:
+                    self.spill(v)
+
+        return self.vars
+
+class Coloring(dict):
+    '''Graph coloring allocator after Chaitin and Briggs, mapping variables
+    to register numbers. Variables live at the same time interfere and get
+    different registers. Copies between variables that do not interfere are
+    coalesced when that cannot make the graph harder to color. Variables
+    that cannot be colored are spilled and the rest are colored again.
+    Arrays and the variables in cfg.toSpill are not allocated'''
+
+    def __init__(self, cfg, nreg):
+        self.cfg = cfg
+        self.nreg = nreg
+        self.spilled = []
+        cfg.liveness()
+        self.across = acrossCalls(cfg)
+        self.build()
+        excluded = { i for i, var in enumerate(cfg.vars) \
+                     if isinstance(var, ir.Array) or var in cfg.toSpill }
+
+        while True:
+            colors, spilled = self.color(excluded)
+
+            if not spilled:
+                break
+
+            excluded |= set(spilled)
+            self.spilled += [ cfg.vars[i] for i in spilled ]
+
+        for i, color in colors.items():
+            self[cfg.vars[i]] = color
+
+    def build(self):
+        '''Interference graph, as a set of neighbours for each variable
+        number, copies between variables and spill costs, from the liveness
+        after every statement. Spill costs are the uses and assignments of
+        every variable, weighted by loop depth'''
+
+        cfg = self.cfg
+        varnum = cfg.varnum
+        self.adj = [ set() for var in cfg.vars ]
+        self.moves = []
+        self.costs = [ 0 ] * len(cfg.vars)
+        depths = loopDepths(cfg)
+
+        for block in cfg:
+            live = block.liveout
+            weight = LOOP_WEIGHT ** depths[block]
+
+            for stmt in reversed(block):
+                uses = bitset(stmt.uses(), varnum)
+
+                if isinstance(stmt, ir.AssignStmt):
+                    defs = bitset(stmt.defines(), varnum)
+                    others = live & ~defs
+
+                    # A copy does not make its source and destination
+                    # interfere, so they can be coalesced
+
+                    if isinstance(stmt.expr, ir.VarExpr) and \
+                       not isinstance(stmt.expr, ir.ArrayExpr) and \
+                       not isinstance(stmt.lvalue, ir.ArrayExpr):
+                        others &= ~uses
+                        self.moves.append((varnum[stmt.lvalue.var], \
+                                           varnum[stmt.expr.var]))
+
+                    for i in indices(defs):
+                        self.costs[i] += weight
+                        self.interfere(i, others)
+
+                    live &= ~defs
+
+                for i in indices(uses):
+                    self.costs[i] += weight
+
+                live |= uses
+
+        # Variables with an initial value are set on entry, while the
+        # variables live on entry hold their values
+
+        entry = cfg.first.livein | \
+                bitset([ var for var in initialized(cfg.func.block) \
+                         if var in varnum ], varnum)
+
+        for i in indices(entry):
+            self.interfere(i, entry & ~(1 << i))
+
+    def interfere(self, i, bits):
+        adj = self.adj
+
+        for j in indices(bits):
+            adj[i].add(j)
+            adj[j].add(i)
+
+    def color(self, excluded):
+        '''Coalesce, simplify and select, leaving out the variable numbers
+        in excluded. Returns a map from variable number to color and a list
+        of the variable numbers that could not be colored'''
+
+        k = self.nreg
+        adj = [ set() if i in excluded else self.adj[i] - excluded \
+                for i in range(len(self.adj)) ]
+        alias = list(range(len(adj)))
+        members = [ [ i ] for i in range(len(adj)) ]
+        costs = list(self.costs)
+
+        def find(i):
+            while alias[i] != i:
+                i = alias[i]
+
+            return i
+
+        # Briggs' conservative coalescing: merge the ends of a copy if the
+        # result has less than k neighbours of degree k or more
+
+        changed = True
+
+        while changed:
+            changed = False
+
+            for dst, src in self.moves:
+                dst = find(dst)
+                src = find(src)
 
-            if var in theVars:
-                interfering |= theVars
+                if dst == src or dst in excluded or src in excluded or \
+                   src in adj[dst]:
+                    continue
 
-            return set(range(self.nRegs)) - interfering
+                union = adj[dst] | adj[src]
+
+                if sum(len(adj[j]) >= k for j in union) >= k:
+                    continue
+
+                for j in adj[src]:
+                    adj[j].discard(src)
+                    adj[j].add(dst)
+
+                adj[dst] = union
+                adj[src] = set()
+                alias[src] = dst
+                members[dst] += members[src]
+                costs[dst] += costs[src]
+                changed = True
+
+        # Simplify: remove nodes of degree less than k, which can always be
+        # colored. If there are none, remove the one with the lowest cost
+        # for its degree, and hope it gets a color anyway (optimistic
+        # coloring)
+
+        remaining = { i for i in range(len(adj)) \
+                      if i not in excluded and alias[i] == i }
+        degree = { i : len(adj[i]) for i in remaining }
+        low = [ i for i in sorted(remaining) if degree[i] < k ]
+        stack = []
+
+        while remaining:
+            if low:
+                i = low.pop()
+            else:
+                i = min(remaining, key = lambda i : (costs[i] / degree[i], i))
+
+            remaining.remove(i)
+            stack.append(i)
+
+            for j in adj[i]:
+                if j in remaining:
+                    degree[j] -= 1
+
+                    if degree[j] == k - 1:
+                        low.append(j)
+
+        # Select: give every node the first color its neighbours do not have.
+        # Nodes live across a call try the callee-saved registers first
+
+        colors = { }
+        spilled = []
+
+        while stack:
+            i = stack.pop()
+            used = { colors[j] for j in adj[i] if j in colors }
+            across = any(self.across & 1 << j for j in members[i])
+            free = [ c for c in preference(k, across) if c not in used ]
+
+            if free:
+                colors[i] = free[0]
+            else:
+                spilled += members[i]
+
+        return { j : colors[i] for i in colors for j in members[i] }, spilled
+
+    def toSpill(self):
+        '''Variables to be kept on the stack, other than cfg.toSpill'''
+
+        arrays = [ var for var in self.cfg.vars if isinstance(var, ir.Array) ]
+        return sorted(arrays + self.spilled, key = lambda v : v.serial)
 
     def __call__(self):
-        toSpill = self.toSpill()
+        return self
 
-        if len(toSpill):
-            print(toSpill)
-            raise Exception('Spill has not been performed!')
+def bitset(variables, varnum):
+    bits = 0
 
-        while len(self.varFreq):
-            v = self.varFreq.pop(0)
+    for var in variables:
+        bits |= 1 << varnum[var]
 
-            if not self.vars[v]:
-                try:
-                    self.replace(v, self.nextFreeReg())
-                except NotEnoughRegsException:
-                    candidateRegs = self.getNonInterfering(v)
+    return bits
 
-                    if len(candidateRegs):
-                        self.replace(v, candidateRegs[0])
-                    else:
-                        self.vars
-                        raise Exception('A spill is needed')
+def indices(bits):
+    '''Numbers of the bits set in bits'''
 
-        return self.vars
-        
-    
-
-    
-            
-        
-        
-    
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def initialized(block):
+    '''Scalar variables declared in block with an initial value'''
+
+    stack = [ block ]
+
+    while stack:
+        for stmt in stack.pop().lstmt:
+            if isinstance(stmt, ir.Block):
+                stack.append(stmt)
+            elif isinstance(stmt, ir.Variable) and \
+                 not isinstance(stmt, ir.Array) and stmt.value != None:
+                yield stmt
+
+def loopDepths(cfg):
+    '''Number of natural loops around every block'''
+
+    depths = { block : 0 for block in cfg }
+
+    for body in cfg.loops.values():
+        for block in body:
+            depths[block] += 1
+
+    return depths
+
+def spillCosts(cfg):
+    '''Times every variable is used or assigned, an access in a loop
+    weighing LOOP_WEIGHT times as much as one outside it'''
+
+    depths = loopDepths(cfg)
+    costs = { }
+
+    for block in cfg:
+        weight = LOOP_WEIGHT ** depths[block]
+
+        for stmt in block:
+            accessed = list(stmt.uses())
+
+            if isinstance(stmt, ir.AssignStmt):
+                accessed += stmt.defines()
+
+            for var in accessed:
+                costs[var] = costs.get(var, 0) + weight
+
+    return costs
+
+def calls(stmt):
+    '''Number of function calls in a statement'''
+
+    stack = ssa.exprs(stmt)
+    count = isinstance(stmt, ir.PrintStmt)
+
+    while stack:
+        expr = stack.pop()
+
+        if isinstance(expr, ir.CallExpr):
+            count += 1
+            stack += expr.lexpr
+        elif isinstance(expr, ir.BinExpr):
+            stack.append(expr.expr1)
+            stack.append(expr.expr2)
+        elif isinstance(expr, ir.InverseExpr):
+            stack.append(expr.expr)
+
+    return count
+
+def across(stmt, live, varnum):
+    '''Bit set of the variables that must survive the calls in stmt, given
+    those live after it: the ones not assigned by it, and also the ones it
+    reads, unless its only call is the whole expression of an assignment,
+    return or call statement, or a print, and so comes after every read'''
+
+    if isinstance(stmt, ir.AssignStmt):
+        live &= ~bitset(stmt.defines(), varnum)
+
+    # A condition reads its second operand after a call in the first one
+
+    top = ssa.exprs(stmt)
+    last = isinstance(stmt, ir.PrintStmt) or \
+           not isinstance(stmt, ir.Condition) and \
+           isinstance(top[0], ir.CallExpr)
+
+    if calls(stmt) > 1 or not last:
+        live |= bitset(stmt.uses(), varnum)
+
+    return live
+
+def acrossCalls(cfg):
+    '''Bit set of the variables live across a call'''
+
+    varnum = cfg.varnum
+    result = 0
+
+    for block in cfg:
+        live = block.liveout
+
+        for stmt in reversed(block):
+            if calls(stmt):
+                result |= across(stmt, live, varnum)
+
+            if isinstance(stmt, ir.AssignStmt):
+                live &= ~bitset(stmt.defines(), varnum)
+
+            live |= bitset(stmt.uses(), varnum)
+
+    return result
+
+def preference(nreg, across):
+    '''Registers in the order to try them. A variable live across a call
+    saves instructions in a callee-saved one, saved once per function
+    instead of around every call'''
+
+    if across:
+        return list(range(CALLER_SAVED, nreg)) + list(range(CALLER_SAVED))
+    else:
+        return list(range(nreg))
@@ -0,0 +1,277 @@
+# Static single assignment form
+
+# Scalar variables are renamed into ir.Version objects, one per definition,
+# with ir.PhiStmt at the start of the blocks where definitions meet. The
+# original variable stands for the value on entry (parameters and initial
+# values). Arrays are not renamed.
+
+import ir
+import cfg
+
+def exprs(stmt):
+    '''Top-level expressions read by a statement'''
+
+    if isinstance(stmt, ir.AssignStmt) or isinstance(stmt, ir.ReturnStmt):
+        return [ stmt.expr ]
+    elif isinstance(stmt, ir.Condition):
+        return [ stmt.expr1, stmt.expr2 ]
+    elif isinstance(stmt, ir.PrintStmt):
+        return [ expr for expr in stmt.lexpr if not isinstance(expr, str) ]
+    elif isinstance(stmt, ir.Expression):
+        return [ stmt ]
+    else:
+        return []
+
+def varExprs(stmt):
+    '''VarExpr objects read by a statement, not including its lvalue'''
+
+    stack = exprs(stmt)
+
+    while stack:
+        expr = stack.pop()
+
+        if isinstance(expr, ir.VarExpr):
+            yield expr
+        elif isinstance(expr, ir.BinExpr):
+            stack.append(expr.expr1)
+            stack.append(expr.expr2)
+        elif isinstance(expr, ir.InverseExpr):
+            stack.append(expr.expr)
+        elif isinstance(expr, ir.CallExpr):
+            stack += expr.lexpr
+
+def scalar(expr):
+    return isinstance(expr, ir.VarExpr) and not isinstance(expr.var, ir.Array)
+
+def origin(var):
+    return var.origin if isinstance(var, ir.Version) else var
+
+def varExpr(var):
+    return ir.VarExpr(var.name, { var.name : var })
+
+def construct(graph):
+    '''Put graph into SSA form. Phis are only placed where the variable is
+    live (pruned SSA)'''
+
+    graph.liveness()
+    preds = graph.preds
+    defsites = { }
+
+    for block in graph.blocks:
+        for stmt in block:
+            if isinstance(stmt, ir.AssignStmt) and scalar(stmt.lvalue):
+                sites = defsites.setdefault(stmt.lvalue.var, [])
+
+                if not sites or sites[-1] is not block:
+                    sites.append(block)
+
+    # Phis at the iterated dominance frontier of the definitions
+
+    for var in sorted(defsites, key = lambda v : v.serial):
+        bit = 1 << graph.varnum[var]
+        placed = set()
+        work = list(defsites[var])
+
+        while work:
+            for block in graph.frontiers[work.pop()]:
+                if block not in placed:
+                    placed.add(block)
+
+                    if block.livein & bit:
+                        block.insert(0, ir.PhiStmt(var, len(preds[block])))
+                        work.append(block)
+
+    # Renaming, walking the dominator tree
+
+    table = ir.SymbolTable()
+    counters = { }
+    stacks = { var : [ var ] for var in defsites }
+    walk = [ (graph.first, None) ]
+
+    def define(var):
+        counters[var] = counters.get(var, 0) + 1
+        version = ir.Version(var, counters[var], table)
+        stacks[var].append(version)
+        return version
+
+    while walk:
+        block, pushed = walk.pop()
+
+        if pushed != None:
+            for var in pushed:
+                stacks[var].pop()
+
+            continue
+
+        pushed = []
+
+        for stmt in block:
+            if isinstance(stmt, ir.PhiStmt):
+                stmt.var = define(stmt.origin)
+                pushed.append(stmt.origin)
+                continue
+
+            for expr in varExprs(stmt):
+                if expr.var in stacks:
+                    expr.var = stacks[expr.var][-1]
+
+            if isinstance(stmt, ir.AssignStmt) and scalar(stmt.lvalue):
+                var = stmt.lvalue.var
+                stmt.lvalue.var = define(var)
+                pushed.append(var)
+
+        for child in unique(block.children):
+            phis = [ stmt for stmt in child if isinstance(stmt, ir.PhiStmt) ]
+
+            for i, pred in enumerate(preds[child]):
+                if pred is block:
+                    for phi in phis:
+                        phi.args[i] = stacks[phi.origin][-1]
+
+        walk.append((block, pushed))
+        walk += [ (child, None) for child in reversed(graph.domtree[block]) ]
+
+def destruct(graph):
+    '''Take graph out of SSA form. Phis become copies at the end of the
+    predecessors, splitting critical edges. Then the versions of a variable
+    are renamed back to it, unless two of them are live at once'''
+
+    preds = graph.preds
+    table = ir.SymbolTable()
+    splits = []
+
+    for block in graph.blocks:
+        phis = [ stmt for stmt in block if isinstance(stmt, ir.PhiStmt) ]
+
+        if not phis:
+            continue
+
+        del block[:len(phis)]
+
+        for i, pred in enumerate(preds[block]):
+            copies = [ (phi.var, phi.args[i]) for phi in phis \
+                       if phi.var is not phi.args[i] ]
+
+            if not copies:
+                continue
+
+            if len(pred.children) > 1:
+                node = cfg.Node()
+                node.children = [ block ]
+                replaceChild(pred, block, node)
+                splits.append((pred, node, block))
+                pred = node
+
+            pred += sequence(copies, table, graph.func)
+
+    graph.invalidate()
+    coalesce(graph)
+
+    for pred, node, block in splits:
+        if not node:
+            replaceChild(pred, node, block)
+
+    graph.invalidate()
+
+def sequence(copies, table, func):
+    '''Assignments doing a list of (destination, source) copies at once'''
+
+    dsts = { dst for dst, src in copies }
+    temps = []
+    stmts = []
+
+    for dst, src in copies:
+        if src in dsts:
+            temp = ir.Version(origin(src), 't' + str(len(table)), table)
+            temps.append(ir.AssignStmt(varExpr(temp), varExpr(src), func))
+            src = temp
+
+        stmts.append(ir.AssignStmt(varExpr(dst), varExpr(src), func))
+
+    return temps + stmts
+
+def coalesce(graph):
+    '''Rename versions back to their variables, except variables with two
+    versions live at the same time. Copies between the same variable are
+    removed'''
+
+    graph.liveness()
+    varnum = graph.varnum
+    groups = { }
+
+    for var in graph.vars:
+        groups[origin(var)] = groups.get(origin(var), 0) | 1 << varnum[var]
+
+    conflicts = set()
+
+    for block in graph.blocks:
+        live = block.liveout
+
+        for stmt in reversed(block):
+            if isinstance(stmt, ir.AssignStmt):
+                var = stmt.lvalue.var
+
+                if scalar(stmt.lvalue):
+                    others = live & groups[origin(var)] & ~(1 << varnum[var])
+
+                    if isinstance(stmt.expr, ir.VarExpr):
+                        others &= ~cfg.bitset(stmt.expr.uses(), varnum)
+
+                    if others:
+                        conflicts.add(origin(var))
+
+                live &= ~cfg.bitset(stmt.defines(), varnum)
+
+            live |= cfg.bitset(stmt.uses(), varnum)
+
+    for block in graph.blocks:
+        stmts = []
+
+        for stmt in block:
+            for expr in varExprs(stmt):
+                if origin(expr.var) not in conflicts:
+                    expr.var = origin(expr.var)
+
+            if isinstance(stmt, ir.AssignStmt) and scalar(stmt.lvalue):
+                lvalue = stmt.lvalue
+
+                if origin(lvalue.var) not in conflicts:
+                    lvalue.var = origin(lvalue.var)
+
+                if isinstance(stmt.expr, ir.VarExpr) and \
+                   stmt.expr.var is lvalue.var:
+                    continue
+
+            stmts.append(stmt)
+
+        block[:] = stmts
+
+def realign(graph, preds):
+    '''Align the arguments of the phis with graph.preds again, after edges
+    were removed. preds is the map they were aligned with'''
+
+    graph.invalidate()
+
+    for block in graph.blocks:
+        old = preds[block]
+
+        for stmt in block:
+            if isinstance(stmt, ir.PhiStmt):
+                stmt.args = [ next(arg for pred, arg in zip(old, stmt.args) \
+                                   if pred is new) \
+                              for new in graph.preds[block] ]
+
+def replaceChild(node, old, new):
+    for i, child in enumerate(node.children):
+        if child is old:
+            node.children[i] = new
+            return
+
+def unique(nodes):
+    result = []
+
+    for node in nodes:
+        if not any(node is other for other in result):
+            result.append(node)
+
+    return result
@@ -0,0 +1,210 @@
+# Local value numbering
+
+# Works on SSA form, where a variable never changes once assigned. Within a
+# block, expressions get a number from their operator and the numbers of
+# their operands, so equal numbers mean equal values. An expression whose
+# number is already held by a variable is replaced by that variable. An
+# expression that is computed more than once and has no such variable is
+# first assigned to a new temporary.
+
+import ir
+import ssa
+import deadcode
+
+commutative = { '+', '*' }
+
+class Numbering:
+    '''Value numbers of the expressions in a block, as it is walked'''
+
+    def __init__(self):
+        self.keys = { }     # (operator, operand numbers...) -> number
+        self.vars = { }     # variable -> number
+        self.numbers = { }  # id of an expression -> number
+        self.epochs = { }   # array -> stores to it so far
+        self.calls = 0      # statements with calls so far
+        self.barrier = False # whether the current statement has a call
+        self.count = 0
+
+    def fresh(self):
+        self.count += 1
+        return self.count
+
+    def lookup(self, key):
+        number = self.keys.get(key)
+
+        if number == None:
+            number = self.keys[key] = self.fresh()
+
+        return number
+
+    def value(self, expr):
+        '''Value number of an expression, remembered in numbers'''
+
+        number = self.numbers.get(id(expr))
+
+        if number == None:
+            number = self.numbers[id(expr)] = self.compute(expr)
+
+        return number
+
+    def compute(self, expr):
+        if isinstance(expr, ir.ConstExpr):
+            return self.lookup(('const', expr.value))
+        elif isinstance(expr, ir.ArrayExpr):
+            if self.barrier:
+                return self.fresh()
+
+            return self.lookup(('load', expr.var, expr.index, \
+                                self.epochs.get(expr.var, 0), self.calls))
+        elif isinstance(expr, ir.VarExpr):
+            number = self.vars.get(expr.var)
+
+            if number == None:
+                number = self.vars[expr.var] = self.fresh()
+
+            return number
+        elif isinstance(expr, ir.InverseExpr):
+            return self.lookup(('-', self.value(expr.expr)))
+        elif isinstance(expr, ir.BinExpr):
+            operands = (self.value(expr.expr1), self.value(expr.expr2))
+
+            if expr.oper in commutative:
+                operands = tuple(sorted(operands))
+
+            return self.lookup((expr.oper,) + operands)
+        elif isinstance(expr, ir.CallExpr):
+            for arg in expr.lexpr:
+                self.value(arg)
+
+            return self.fresh()
+        else:
+            return self.fresh()
+
+    def before(self, stmt):
+        self.barrier = hasCall(stmt)
+
+    def after(self, stmt):
+        '''Update the numbering after stmt is executed'''
+
+        if isinstance(stmt, ir.AssignStmt):
+            if ssa.scalar(stmt.lvalue):
+                self.vars[stmt.lvalue.var] = self.value(stmt.expr)
+            elif isinstance(stmt.lvalue, ir.ArrayExpr):
+                array = stmt.lvalue.var
+                self.epochs[array] = self.epochs.get(array, 0) + 1
+
+        if self.barrier:
+            self.calls += 1
+
+def computed(expr):
+    '''Whether reusing expr saves work'''
+
+    return isinstance(expr, ir.BinExpr) or isinstance(expr, ir.InverseExpr) or \
+           isinstance(expr, ir.ArrayExpr)
+
+def children(expr):
+    if isinstance(expr, ir.BinExpr):
+        return [ expr.expr1, expr.expr2 ]
+    elif isinstance(expr, ir.InverseExpr):
+        return [ expr.expr ]
+    elif isinstance(expr, ir.CallExpr):
+        return expr.lexpr
+    else:
+        return []
+
+def hasCall(stmt):
+    '''Whether stmt calls a function, which may change the arrays'''
+
+    return isinstance(stmt, ir.PrintStmt) or \
+           any(deadcode.hasCall(expr) for expr in ssa.exprs(stmt))
+
+def count(block, numbering):
+    '''Number the expressions in block. Returns the times each number is
+    computed, not counting the parts of an expression that will be replaced
+    as a whole'''
+
+    counts = { }
+
+    for stmt in block:
+        numbering.before(stmt)
+        stack = ssa.exprs(stmt)
+
+        while stack:
+            expr = stack.pop()
+            number = numbering.value(expr)
+
+            if computed(expr):
+                counts[number] = counts.get(number, 0) + 1
+
+                if counts[number] > 1:
+                    continue
+
+            stack += children(expr)
+
+        numbering.after(stmt)
+
+    return counts
+
+def numberBlock(block, table, func):
+    '''Value numbering of a block. Returns the number of expressions
+    replaced'''
+
+    numbering = Numbering()
+    counts = count(block, numbering)
+    holders = { }   # value number -> variable holding it
+    stmts = []
+    replaced = 0
+
+    def rewrite(expr, top):
+        nonlocal replaced
+        number = numbering.numbers[id(expr)]
+
+        if computed(expr) and number in holders:
+            replaced += 1
+            return ssa.varExpr(holders[number])
+
+        if isinstance(expr, ir.BinExpr):
+            expr.expr1 = rewrite(expr.expr1, False)
+            expr.expr2 = rewrite(expr.expr2, False)
+        elif isinstance(expr, ir.InverseExpr):
+            expr.expr = rewrite(expr.expr, False)
+        elif isinstance(expr, ir.CallExpr):
+            expr.lexpr = [ rewrite(arg, False) for arg in expr.lexpr ]
+
+        if computed(expr) and counts.get(number, 0) > 1 and not top:
+            temp = ir.Variable('t' + str(len(table)), expr.etype, None, table)
+            stmts.append(ir.AssignStmt(ssa.varExpr(temp), expr, func))
+            holders[number] = temp
+            return ssa.varExpr(temp)
+
+        return expr
+
+    for stmt in block:
+        if isinstance(stmt, ir.AssignStmt):
+            stmt.expr = rewrite(stmt.expr, ssa.scalar(stmt.lvalue))
+        elif isinstance(stmt, ir.ReturnStmt):
+            stmt.expr = rewrite(stmt.expr, False)
+        elif isinstance(stmt, ir.Condition):
+            stmt.expr1 = rewrite(stmt.expr1, False)
+            stmt.expr2 = rewrite(stmt.expr2, False)
+        elif isinstance(stmt, ir.PrintStmt):
+            stmt.lexpr = [ expr if isinstance(expr, str) else \
+                           rewrite(expr, False) for expr in stmt.lexpr ]
+        elif isinstance(stmt, ir.CallExpr):
+            rewrite(stmt, False)
+
+        stmts.append(stmt)
+
+        if isinstance(stmt, ir.AssignStmt) and ssa.scalar(stmt.lvalue):
+            holders.setdefault(numbering.vars[stmt.lvalue.var], \
+                               stmt.lvalue.var)
+
+    block[:] = stmts
+    return replaced
+
+def number(graph):
+    '''Local value numbering of every block. Returns the number of
+    expressions replaced by a variable'''
+
+    table = ir.SymbolTable()
+    return sum(numberBlock(block, table, graph.func) for block in graph)